@@ -1,3 +1,43 @@
-from powerguess.guess import PowerStatMonitor
-from powerguess.sensors import BatterySensor, BatteryPowerSensor, BatteryStatusSensor, BatteryChargingSensor, \
-    BatteryCurrentSensor, BatteryVoltageSensor, BatteryStoredEnergySensor, BatteryChargeSensor, BatteryEnergyDeltaSensor
+import importlib
+
+# resolved on first access, importing powerguess must stay cheap and never
+# pull in ovos_PHAL_sensors, psutil or run hardware detection
+_LAZY = {
+    "PowerStatMonitor": "powerguess.guess",
+    "PowerMonitor": "powerguess.monitor",
+    "get_monitor": "powerguess.monitor",
+    "GuessSource": "powerguess.sources",
+    "BatterySource": "powerguess.sources",
+    "RAPLSource": "powerguess.sources",
+    "PowerStatSource": "powerguess.sources",
+    "PowerGuessPowerSensor": "powerguess.sensors",
+    "PowerGuessCurrentSensor": "powerguess.sensors",
+    "PowerGuessVoltageSensor": "powerguess.sensors",
+    "PowerGuessEnergySensor": "powerguess.sensors",
+    "BatterySensor": "powerguess.sensors",
+    "BatteryPowerConsumptionSensor": "powerguess.sensors",
+    "BatteryPowerProductionSensor": "powerguess.sensors",
+    "BatteryStatusSensor": "powerguess.sensors",
+    "BatteryChargingSensor": "powerguess.sensors",
+    "BatteryCurrentSensor": "powerguess.sensors",
+    "BatteryVoltageSensor": "powerguess.sensors",
+    "BatteryStoredEnergySensor": "powerguess.sensors",
+    "BatteryChargeSensor": "powerguess.sensors",
+    "BatteryEnergyDeltaSensor": "powerguess.sensors",
+    "BatteryTimeToEmptySensor": "powerguess.sensors",
+    "BatteryTimeToFullSensor": "powerguess.sensors",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'powerguess' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
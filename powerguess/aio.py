@@ -0,0 +1,190 @@
+""" asyncio power monitor, sampling runs as a task on the event loop, the
+blocking sysfs and psutil reads of each sample run on the default executor
+
+    monitor = AsyncPowerMonitor()
+    await monitor.start()
+    async for p, v, i in monitor.stream():
+        print(p, "W")
+"""
+import asyncio
+import os
+import pty
+import shutil
+
+from powerguess.filters import ReadingFilter
+from powerguess.powerstat import POWERSTAT_COMMAND, parse_powerstat_line
+from powerguess.rapl import RAPLReader, POWERCAP_ROOT
+from powerguess.sources import GuessSource, BatterySource
+
+
+class AsyncPowerMonitor:
+    """ samples RAPL, powerstat or the estimate on the running event loop
+
+    every stream() subscriber gets its own bounded queue, a subscriber that
+    falls behind loses its oldest readings instead of slowing the others
+    """
+
+    def __init__(self, time_between_measures=5, filters=None, powerstat_command=POWERSTAT_COMMAND,
+                 rapl_root=POWERCAP_ROOT, disable_powerstat=False, disable_rapl=False,
+                 min_backoff=1, max_backoff=60, model=None):
+        self.time_between_measures = time_between_measures
+        self.filters = ReadingFilter(**(filters or {}))
+        self.powerstat_command = powerstat_command
+        self.rapl_root = rapl_root
+        self.disable_powerstat = disable_powerstat
+        self.disable_rapl = disable_rapl
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.guess = GuessSource(model)
+        self.battery = BatterySource()
+        self.current_value = 0, 0, 0  # (p, v, i)
+        self.source = None
+        self._subscribers = set()
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            self._task.add_done_callback(self._done)
+
+    def _done(self, task):
+        # nobody awaits the task while it runs, report why it ended
+        if not task.cancelled() and task.exception():
+            print(f"power monitor stopped: {task.exception()!r}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for q in list(self._subscribers):
+            self._offer(q, None)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    @staticmethod
+    def _offer(q, item):
+        if q.full():
+            q.get_nowait()
+        q.put_nowait(item)
+
+    def _sample(self, read):
+        """ (p, v, i) from read(), measured watts or None for the estimate, blocking """
+        p = read()
+        # assume battery output == total laptop input
+        pe, v, i = self.battery.output()
+        if not pe:
+            pe, v, i = self.guess.estimate()
+        pb, vb, ib = self.battery.consumption()
+        p = (pe if p is None else p) + pb
+        if v:
+            i = p / v
+        return p, v, i
+
+    async def _publish(self, read):
+        """ filtered (p, v, i) of one sample to every subscriber, see _sample """
+        p, v, i = await asyncio.get_running_loop().run_in_executor(None, self._sample, read)
+        if not p:
+            return  # 0 power consumption is impossible
+        reading = self.filters.update((p, v, i))
+        self.current_value = reading
+        for q in self._subscribers:
+            self._offer(q, reading)
+
+    async def stream(self, maxsize=16):
+        """ async iterator over (p, v, i) readings, ends when the monitor stops """
+        q = asyncio.Queue(maxsize)
+        self._subscribers.add(q)
+        try:
+            while True:
+                reading = await q.get()
+                if reading is None:
+                    return
+                yield reading
+        finally:
+            self._subscribers.discard(q)
+
+    async def _run(self):
+        if not self.disable_rapl:
+            rapl = RAPLReader(self.rapl_root)
+            if rapl.available:
+                self.source = "rapl"
+                try:
+                    await self._poll(rapl.power)
+                finally:
+                    rapl.close()
+                return
+        if not self.disable_powerstat and shutil.which("powerstat"):
+            self.source = "powerstat"
+            await self._stream_powerstat()
+            return
+        self.source = "estimate"
+        await self._poll(lambda: None)
+
+    async def _poll(self, read):
+        await asyncio.get_running_loop().run_in_executor(None, read)  # counters need a first sample
+        while True:
+            await asyncio.sleep(self.time_between_measures)
+            try:
+                await self._publish(read)
+            except Exception as e:
+                print(f"{self.source} measure failed: {e}")
+
+    async def _powerstat_once(self):
+        """ one powerstat process until EOF, returns number of samples """
+        # a pty keeps powerstat line buffered, a pipe would make it block buffer
+        master, slave = pty.openpty()
+        proc = await asyncio.create_subprocess_shell(self.powerstat_command, stdin=slave,
+                                                     stdout=slave, stderr=slave)
+        os.close(slave)
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                                    os.fdopen(master, "rb", 0))
+        n = 0
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except OSError:  # EIO on the pty once the child exits
+                    break
+                if not line:
+                    break
+                watts = parse_powerstat_line(line.decode("utf-8", "replace"))
+                if watts is not None:
+                    n += 1
+                    try:
+                        await self._publish(lambda: watts)
+                    except Exception as e:
+                        print(f"{self.source} measure failed: {e}")
+        finally:
+            transport.close()
+            if proc.returncode is None:
+                proc.terminate()  # sudo relays SIGTERM, not SIGKILL
+            await proc.wait()
+        return n
+
+    async def _stream_powerstat(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                if await self._powerstat_once():
+                    backoff = self.min_backoff
+                else:
+                    backoff = min(backoff * 2, self.max_backoff)
+            except (OSError, ValueError) as e:
+                print(f"powerstat failed: {e}")
+                backoff = min(backoff * 2, self.max_backoff)
+            await asyncio.sleep(backoff)
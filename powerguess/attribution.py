@@ -0,0 +1,102 @@
+import os
+import time
+
+from powerguess.monitor import get_monitor
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def read_process_cpu_times(proc_root="/proc"):
+    """ {pid: (name, cpu seconds)} for every process, one pass over /proc/<pid>/stat """
+    times = {}
+    for entry in os.scandir(proc_root):
+        if not entry.name.isdigit():
+            continue
+        try:
+            fd = os.open(f"{entry.path}/stat", os.O_RDONLY)
+            try:
+                data = os.read(fd, 1024)
+            finally:
+                os.close(fd)
+            # pid (comm) state ppid ... utime stime, comm may contain spaces and parens
+            start = data.find(b"(")
+            end = data.rfind(b")")
+            fields = data[end + 2:].split()
+            times[int(entry.name)] = (data[start + 1:end].decode("utf-8", "replace"),
+                                      (int(fields[11]) + int(fields[12])) / _CLK_TCK)
+        except (OSError, IndexError, ValueError):  # exited while listing, empty or truncated stat
+            continue
+    return times
+
+
+class PowerAttribution:
+    """ splits measured or estimated power above idle across processes by cpu time
+
+    feed it readings with update() or register callback() on a PowerStatMonitor
+    """
+
+    def __init__(self, idle_power=None, proc_root="/proc", monitor="default"):
+        self.proc_root = proc_root
+        self.monitor = monitor
+        self._idle_power = idle_power
+        self._cpu_times = {}
+        self._timestamp = None
+        self.pid_names = {}
+        self.pid_power = {}  # W
+        self.pid_energy = {}  # J, live processes only
+        self.name_power = {}  # W
+        self.name_energy = {}  # J, accumulated since start
+
+    @property
+    def idle_power(self):
+        if self._idle_power is not None:
+            return self._idle_power
+        # idle baseline from the load curve of the registered monitor
+        guess = getattr(get_monitor(self.monitor), "guess", None)
+        if guess is None or guess.curve is None:
+            return 0
+        return guess.curve.idle_power
+
+    def update(self, power, timestamp=None):
+        """ attribute `power` watts over the time since the previous update """
+        t = time.monotonic() if timestamp is None else timestamp
+        cpu_times = read_process_cpu_times(self.proc_root)
+        prev, prev_t = self._cpu_times, self._timestamp
+        self._cpu_times, self._timestamp = cpu_times, t
+        if prev_t is None or t <= prev_t:
+            return self.pid_power
+        dt = t - prev_t
+
+        deltas = {}
+        for pid, (name, cpu) in cpu_times.items():
+            if pid in prev and prev[pid][0] == name:
+                d = cpu - prev[pid][1]
+            else:  # new process, only count what it used since the last update
+                d = 0
+            if d > 0:
+                deltas[pid] = d
+        total = sum(deltas.values())
+        dynamic = max(power - self.idle_power, 0)
+
+        self.pid_names = {pid: name for pid, (name, _) in cpu_times.items()}
+        self.pid_power = {}
+        self.name_power = {}
+        if total:
+            for pid, d in deltas.items():
+                w = dynamic * d / total
+                name = self.pid_names[pid]
+                self.pid_power[pid] = w
+                self.name_power[name] = self.name_power.get(name, 0) + w
+        self.pid_energy = {pid: self.pid_energy.get(pid, 0) + self.pid_power.get(pid, 0) * dt
+                           for pid in cpu_times}
+        for name, w in self.name_power.items():
+            self.name_energy[name] = self.name_energy.get(name, 0) + w * dt
+        return self.pid_power
+
+    def callback(self, reading, model=None):
+        p, v, i = reading
+        self.update(p)
+
+    def top(self, n=10):
+        """ [(name, watts)] highest consumers first """
+        return sorted(self.name_power.items(), key=lambda k: k[1], reverse=True)[:n]
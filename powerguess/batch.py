@@ -0,0 +1,317 @@
+""" vectorized power and energy estimates over recorded cpu utilisation traces
+
+    python -m powerguess.batch trace.csv --output totals.csv
+    python -m powerguess.batch trace.npy --hosts hosts.json
+
+traces are columnar, a csv with a header naming `timestamp` (unix seconds),
+`host`, `model` and `cpu` (%) columns, optionally `freq` (current/max cpu
+frequency), or numpy arrays with the same columns where `host` is an integer
+id, either one structured .npy or a directory with one .npy per column, both
+are memory mapped and processed in chunks so traces larger than ram work
+
+hosts.json maps numpy host ids to model names, {"0": "pi4", "1": "pc_generic"}
+or ["pi4", "pc_generic"], a model name is a file in powerguess/models, a path
+to a model json or a detected model string like "Raspberry Pi 4 Model B"
+
+every sample is estimated from the same load curve tables as the live
+estimate, energy is integrated per host with the trapezoidal rule, gaps longer
+than `max_gap` seconds are not integrated
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError as e:  # optional, only batch estimates need it
+    raise ImportError("powerguess.batch needs numpy, pip install numpy") from e
+
+from powerguess.curve import LoadCurve, COLUMNS, FREQ_STEP
+from powerguess.sources import GuessSource
+
+MODELS_PATH = f"{os.path.dirname(__file__)}/models"
+TOTALS_FIELDS = ("host", "model", "samples", "mean_w", "max_w", "hours", "energy_wh")
+
+
+def load_curve(model):
+    """ LoadCurve for a model json path, a file in powerguess/models or a detected model string """
+    if os.path.isfile(model):
+        path = model
+    else:
+        path = f"{MODELS_PATH}/{model if model.endswith('.json') else model + '.json'}"
+        if not os.path.isfile(path):
+            path = f"{MODELS_PATH}/{GuessSource.select_benchmark(model)}"
+    with open(path) as f:
+        return LoadCurve.from_model(json.load(f))
+
+
+class BatchEstimator:
+    """ per-host power and energy totals over chunks of samples, all numpy vector ops
+
+    add_host() every host first, then feed chunks to process(), chunks may
+    interleave hosts but the samples of one host must be in time order
+    """
+
+    def __init__(self, max_gap=300):
+        self.max_gap = max_gap
+        self.hosts = []  # host name per host id
+        self.models = []  # model name per host id
+        self.samples = 0
+        self._host_ids = {}
+        self._curve_ids = {}
+        self._curves = []
+        self._host_curve = np.zeros(0, dtype=np.intp)
+        self._tables = None
+        # per host accumulators
+        self._samples = np.zeros(0, dtype=np.int64)
+        self._power_sum = np.zeros(0)
+        self._power_max = np.zeros(0)
+        self._energy = np.zeros(0)  # J
+        self._seconds = np.zeros(0)
+        self._last_t = np.zeros(0)
+        self._last_p = np.zeros(0)
+
+    def add_host(self, host, model):
+        """ host id for `host`, models are loaded once and shared by every host using them """
+        if host in self._host_ids:
+            return self._host_ids[host]
+        if model not in self._curve_ids:
+            self._curve_ids[model] = len(self._curves)
+            self._curves.append(load_curve(model))
+            self._tables = None
+        hid = self._host_ids[host] = len(self.hosts)
+        self.hosts.append(host)
+        self.models.append(model)
+        self._host_curve = np.append(self._host_curve, self._curve_ids[model])
+        for name, fill in (("_samples", 0), ("_power_sum", 0.0), ("_power_max", 0.0),
+                           ("_energy", 0.0), ("_seconds", 0.0), ("_last_t", np.nan),
+                           ("_last_p", 0.0)):
+            setattr(self, name, np.append(getattr(self, name), fill))
+        return hid
+
+    def _compile(self):
+        # every curve table back to back in one array, a host indexes it by offset
+        offsets, default_rows, freq_min, freq_max = [], [], [], []
+        power, error = [], []
+        n = 0
+        for c in self._curves:
+            offsets.append(n)
+            n += len(c.power)
+            freq_min.append(c.freq_min)
+            freq_max.append(c.freq_max)
+            default_rows.append(int(round((min(max(1.0, c.freq_min), c.freq_max) - c.freq_min) / FREQ_STEP)))
+            power.append(np.frombuffer(c.power, dtype=np.float64))
+            error.append(np.frombuffer(c.error, dtype=np.float64))
+        self._tables = {"offset": np.array(offsets, dtype=np.intp),
+                        "default_row": np.array(default_rows, dtype=np.intp),
+                        "freq_min": np.array(freq_min),
+                        "freq_max": np.array(freq_max),
+                        "power": np.concatenate(power),
+                        "error": np.concatenate(error)}
+
+    def _index(self, cpu, host_ids, freq=None):
+        if self._tables is None:
+            self._compile()
+        tables = self._tables
+        u = np.clip(np.asarray(cpu, dtype=np.float64), 0, 100)
+        k = np.minimum(u.astype(np.intp), COLUMNS - 2)
+        frac = u - k
+        curve = self._host_curve[host_ids]
+        if freq is None:
+            row = tables["default_row"][curve]
+        else:
+            fmin = tables["freq_min"][curve]
+            f = np.clip(np.asarray(freq, dtype=np.float64), fmin, tables["freq_max"][curve])
+            row = np.rint((f - fmin) / FREQ_STEP).astype(np.intp)
+        return tables["offset"][curve] + row * COLUMNS + k, frac
+
+    def power(self, cpu, host_ids, freq=None):
+        """ W for every sample """
+        idx, frac = self._index(cpu, host_ids, freq)
+        P = self._tables["power"]
+        return P[idx] + (P[idx + 1] - P[idx]) * frac
+
+    def error(self, cpu, host_ids, freq=None):
+        """ W, error bound of every sample """
+        idx, frac = self._index(cpu, host_ids, freq)
+        E = self._tables["error"]
+        return E[idx] + (E[idx + 1] - E[idx]) * frac
+
+    def process(self, timestamp, cpu, host_ids, freq=None):
+        """ estimate one chunk and add it to the per-host totals, returns W per sample """
+        host_ids = np.asarray(host_ids, dtype=np.intp)
+        if not len(host_ids):
+            return np.zeros(0)
+        p = self.power(cpu, host_ids, freq)
+        n = len(self.hosts)
+
+        # stable keeps time order within a host, on 16 bit ids numpy uses a radix sort
+        keys = host_ids.astype(np.uint16) if n <= 65536 else host_ids
+        order = np.argsort(keys, kind="stable")
+        h = host_ids[order]
+        t = np.asarray(timestamp, dtype=np.float64)[order]
+        ps = p[order]
+
+        same = h[1:] == h[:-1]
+        dt = np.diff(t)
+        # zeroing skipped segments is cheaper than compressing them out
+        dt *= same & (dt > 0) & (dt <= self.max_gap)
+        self._energy += np.bincount(h[1:], weights=(ps[1:] + ps[:-1]) * 0.5 * dt, minlength=n)
+        self._seconds += np.bincount(h[1:], weights=dt, minlength=n)
+
+        # join the first sample of every host to the last one of the previous chunk
+        starts = np.flatnonzero(np.concatenate(([True], ~same)))
+        ends = np.concatenate((starts[1:] - 1, [len(h) - 1]))
+        hs = h[starts]
+        with np.errstate(invalid="ignore"):
+            dt0 = t[starts] - self._last_t[hs]
+            ok0 = (dt0 > 0) & (dt0 <= self.max_gap)
+        j = hs[ok0]
+        self._energy[j] += (self._last_p[j] + ps[starts][ok0]) * 0.5 * dt0[ok0]
+        self._seconds[j] += dt0[ok0]
+        self._last_t[hs] = t[ends]
+        self._last_p[hs] = ps[ends]
+
+        self._samples += np.bincount(h, minlength=n)
+        self._power_sum += np.bincount(h, weights=ps, minlength=n)
+        self._power_max[hs] = np.maximum(self._power_max[hs], np.maximum.reduceat(ps, starts))
+        self.samples += len(h)
+        return p
+
+    @property
+    def energy_wh(self):
+        return float(self._energy.sum() / 3600)
+
+    def totals(self):
+        """ [{host, model, samples, mean_w, max_w, hours, energy_wh}] """
+        return [{"host": host,
+                 "model": self.models[n],
+                 "samples": int(self._samples[n]),
+                 "mean_w": float(self._power_sum[n] / self._samples[n]) if self._samples[n] else 0.0,
+                 "max_w": float(self._power_max[n]),
+                 "hours": float(self._seconds[n] / 3600),
+                 "energy_wh": float(self._energy[n] / 3600)}
+                for n, host in enumerate(self.hosts)]
+
+
+def iter_csv(estimator, path, chunk_size=1000000):
+    """ (timestamp, cpu, host_ids, freq) chunks from a csv trace, registering hosts as they appear """
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader)]
+        ti, ci, hi, mi = (header.index(k) for k in ("timestamp", "cpu", "host", "model"))
+        fi = header.index("freq") if "freq" in header else None
+        ids = {}
+        while True:
+            t, c, h, fr = [], [], [], []
+            for row in reader:
+                if not row:
+                    continue
+                host = row[hi]
+                if host not in ids:
+                    ids[host] = estimator.add_host(host, row[mi])
+                t.append(float(row[ti]))
+                c.append(float(row[ci]))
+                h.append(ids[host])
+                if fi is not None:
+                    fr.append(float(row[fi]))
+                if len(t) >= chunk_size:
+                    break
+            if not t:
+                return
+            yield (np.array(t), np.array(c), np.array(h, dtype=np.intp),
+                   np.array(fr) if fi is not None else None)
+
+
+def load_columns(path):
+    """ {column: memory mapped array} from a structured .npy or a directory of column .npy files """
+    if os.path.isdir(path):
+        return {name[:-4]: np.load(f"{path}/{name}", mmap_mode="r")
+                for name in os.listdir(path) if name.endswith(".npy")}
+    arr = np.load(path, mmap_mode="r")
+    return {name: arr[name] for name in arr.dtype.names}
+
+
+def iter_npy(estimator, path, hosts=None, model=None, chunk_size=1000000):
+    """ (timestamp, cpu, host_ids, freq) chunks from numpy columns
+
+    hosts: {host id: model} or [model per host id], `model` is used for every
+    host that is not listed
+    """
+    cols = load_columns(path)
+    timestamp, cpu, host = cols["timestamp"], cols["cpu"], cols["host"]
+    freq = cols.get("freq")
+    if isinstance(hosts, list):
+        hosts = dict(enumerate(hosts))
+    hosts = {int(k): v for k, v in (hosts or {}).items()}
+    remap = np.zeros(0, dtype=np.intp)
+    for start in range(0, len(host), chunk_size):
+        h = np.asarray(host[start:start + chunk_size], dtype=np.intp)
+        top = int(h.max()) + 1 if len(h) else 0
+        if top > len(remap):
+            # map numpy host ids to estimator ids, new hosts are registered once
+            new = []
+            for hid in range(len(remap), top):
+                m = hosts.get(hid, model)
+                if m is None:
+                    raise ValueError(f"no model for host {hid}, pass hosts or a default model")
+                new.append(estimator.add_host(str(hid), m))
+            remap = np.concatenate((remap, np.array(new, dtype=np.intp)))
+        yield (timestamp[start:start + chunk_size], cpu[start:start + chunk_size], remap[h],
+               freq[start:start + chunk_size] if freq is not None else None)
+
+
+def estimate_trace(path, hosts=None, model=None, chunk_size=1000000, max_gap=300, progress=None):
+    """ BatchEstimator with every sample of a csv or numpy trace processed
+
+    progress: called with the estimator after every chunk
+    """
+    estimator = BatchEstimator(max_gap)
+    if path.endswith(".csv"):
+        chunks = iter_csv(estimator, path, chunk_size)
+    else:
+        chunks = iter_npy(estimator, path, hosts, model, chunk_size)
+    for t, c, h, f in chunks:
+        estimator.process(t, c, h, f)
+        if progress:
+            progress(estimator)
+    return estimator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="estimate per-host power and energy from cpu utilisation traces")
+    parser.add_argument("trace", help="csv file, structured .npy or directory of column .npy files")
+    parser.add_argument("--hosts", help="json mapping numpy host ids to models")
+    parser.add_argument("--model", help="model for hosts without one, eg. pi4 or pc_generic")
+    parser.add_argument("--chunk-size", type=int, default=1000000)
+    parser.add_argument("--max-gap", type=float, default=300,
+                        help="seconds, longer gaps between samples of a host are not integrated")
+    parser.add_argument("--output", help="write totals csv here instead of stdout")
+    parser.add_argument("--progress", action="store_true", help="print running totals to stderr")
+    args = parser.parse_args()
+
+    hosts = None
+    if args.hosts:
+        with open(args.hosts) as f:
+            hosts = json.load(f)
+
+    def progress(estimator):
+        print(json.dumps({"samples": estimator.samples, "hosts": len(estimator.hosts),
+                          "energy_wh": estimator.energy_wh}), file=sys.stderr)
+
+    estimator = estimate_trace(args.trace, hosts, args.model, args.chunk_size, args.max_gap,
+                               progress if args.progress else None)
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(out, TOTALS_FIELDS)
+        writer.writeheader()
+        writer.writerows(estimator.totals())
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+""" hot path benchmarks against a generated fake sysfs tree, a scripted powerstat and a stubbed cpu
+
+    python -m powerguess.bench --batteries 2 --supplies 2 --save baseline.json
+    python -m powerguess.bench --baseline baseline.json
+
+with --baseline every benchmark whose mean latency got slower than the
+tolerance is reported and the exit code is 1
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from powerguess.guess import PowerStatMonitor
+from powerguess.monitor import unregister_monitor
+from powerguess.powerstat import PowerStatReader, parse_powerstat_line
+from powerguess.supply import PowerSupplyReader
+from powerguess.utils import BatterySnapshot, POWER_SUPPLY_ROOT, get_battery_info
+
+BENCH_MONITOR = "bench"
+POWERSTAT_HEADER = "  Time    User  Nice   Sys  Idle    IO  Run Ctxt/s  IRQ/s Fork Exec Exit  Watts"
+POWERSTAT_LINE = "12:00:01   1.0   0.0   0.5  98.5   0.0    1    512    230    0    0    0   4.21"
+
+FAKE_POWERSTAT = f"""import sys, time
+n, interval = int(sys.argv[1]), float(sys.argv[2])
+print("Running for {{}} seconds".format(n * interval))
+print({POWERSTAT_HEADER!r})
+for k in range(n):
+    print({POWERSTAT_LINE[:-4]!r} + "{{:6.2f}}".format(4 + (k % 10) / 10), flush=interval > 0)
+    if interval:
+        time.sleep(interval)
+print("-------- ----- ----- ----- ----- ----- ---- ------ ------ ---- ---- ---- ------")
+"""
+
+
+def make_fake_power_supply(root, batteries=1, supplies=1):
+    """ /sys/class/power_supply lookalike with `batteries` BAT* and `supplies` mains/usb entries """
+    os.makedirs(root, exist_ok=True)
+    entries = {}
+    for n in range(batteries):
+        entries[f"BAT{n}"] = {
+            "TYPE": "Battery", "STATUS": "Discharging", "PRESENT": 1,
+            "VOLTAGE_NOW": 16904000 - n * 1000, "CURRENT_NOW": 540000 + n * 1000,
+            "POWER_NOW": 9128000, "CHARGE_NOW": 3492000, "CHARGE_FULL": 4400000,
+            "CHARGE_FULL_DESIGN": 4800000, "CAPACITY": 79, "MODEL_NAME": "fake", "TECHNOLOGY": "Li-ion"}
+    for n in range(supplies):
+        name = "AC" if n == 0 else f"USB{n}"
+        entries[name] = {"TYPE": "Mains" if n == 0 else "USB", "ONLINE": 0,
+                         "VOLTAGE_NOW": 5000000, "CURRENT_NOW": 0}
+    for name, attrs in entries.items():
+        d = f"{root}/{name}"
+        os.makedirs(d, exist_ok=True)
+        with open(f"{d}/uevent", "w") as f:
+            f.write(f"POWER_SUPPLY_NAME={name}\n")
+            for k, v in attrs.items():
+                f.write(f"POWER_SUPPLY_{k}={v}\n")
+        for k, v in attrs.items():
+            with open(f"{d}/{k.lower()}", "w") as f:
+                f.write(f"{v}\n")
+    return root
+
+
+def make_fake_powerstat(path):
+    """ script printing recorded powerstat output, args: samples interval """
+    with open(path, "w") as f:
+        f.write(FAKE_POWERSTAT)
+    return f"{sys.executable} {path}"
+
+
+def measure(fn, iterations=1000, warmup=10):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    total = sum(times)
+    return {"ops": iterations / total if total else 0.0,
+            "mean_us": total / iterations * 1e6,
+            "p50_us": times[len(times) // 2] * 1e6,
+            "p99_us": times[min(int(len(times) * 0.99), len(times) - 1)] * 1e6}
+
+
+def measure_powerstat_stream(command, samples=5000):
+    """ throughput of PowerStatReader parsing a fake powerstat as fast as it prints """
+    reader = PowerStatReader(f"{command} {samples} 0", maxsize=samples + 1)
+    start = time.perf_counter()
+    reader.start()
+    received = 0
+    while received < samples:
+        try:
+            reader.readings.get(timeout=10)
+        except Exception:
+            break
+        received += 1
+    total = time.perf_counter() - start
+    reader.stop()
+    return {"ops": received / total if total else 0.0,
+            "mean_us": total / max(received, 1) * 1e6,
+            "p50_us": 0.0,
+            "p99_us": 0.0}
+
+
+def run_benchmarks(batteries=1, supplies=1, iterations=1000, cpu=42.0):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = make_fake_power_supply(f"{tmp}/power_supply", batteries, supplies)
+        command = make_fake_powerstat(f"{tmp}/powerstat.py")
+
+        BatterySnapshot.root = root
+        BatterySnapshot.invalidate()
+        # a dedicated registry name, the default monitor of this process is left alone
+        monitor = PowerStatMonitor(model="Raspberry Pi 4", cpu_source=lambda: cpu, name=BENCH_MONITOR,
+                                   track_energy=False, keep_history=False)
+        monitor.disable_rapl = True
+        monitor.disable_powerstat = True
+        try:
+            _run(results, root, command, monitor, iterations)
+        finally:
+            unregister_monitor(BENCH_MONITOR, monitor)
+            BatterySnapshot.root = POWER_SUPPLY_ROOT
+            BatterySnapshot.invalidate()
+    return results
+
+
+def _run(results, root, command, monitor, iterations):
+    results["get_battery_info"] = measure(lambda: list(get_battery_info(root)), iterations)
+    reader = PowerSupplyReader(root)
+    results["supply_reader_sample"] = measure(reader.sample, iterations)
+    reader.close()
+    results["battery_snapshot_cached"] = measure(BatterySnapshot.get, iterations)
+    results["battery_snapshot_refresh"] = measure(BatterySnapshot.refresh, iterations)
+    results["guesstimate"] = measure(monitor.guesstimate, iterations)
+    results["measure_powerstat"] = measure(lambda: list(monitor.measure_powerstat()), iterations)
+    results["parse_powerstat_line"] = measure(lambda: parse_powerstat_line(POWERSTAT_LINE), iterations)
+    results["powerstat_stream"] = measure_powerstat_stream(command, max(iterations, 1000))
+
+    try:
+        from powerguess.device import PowerSupplyDevice
+        from powerguess.publish import SensorPublisher
+    except ImportError as e:
+        print(f"skipping sensor benchmarks: {e}")
+    else:
+        # one update tick through the publisher, no logger bound so nothing is sent
+        sensors = PowerSupplyDevice.build_sensors()
+        for sensor in sensors:
+            if hasattr(sensor, "monitor"):
+                sensor.monitor = BENCH_MONITOR  # instance attribute, the class default is kept
+        publisher = SensorPublisher()
+
+        def update():
+            with BatterySnapshot.tick():
+                publisher.publish(sensors)
+
+        results["device_update"] = measure(update, iterations)
+        for sensor in sensors:
+            name = f"sensor_{sensor.__class__.__name__}"
+            results[name] = measure(lambda: sensor.value, iterations)
+
+
+def compare(results, baseline, tolerance=0.25):
+    """ names of benchmarks whose mean latency regressed past tolerance """
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base and base["mean_us"] and r["mean_us"] > base["mean_us"] * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="powerguess hot path benchmarks")
+    parser.add_argument("--batteries", type=int, default=1)
+    parser.add_argument("--supplies", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--save", help="write results as a baseline json")
+    parser.add_argument("--baseline", help="compare against a saved baseline json")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed mean latency increase over the baseline, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.batteries, args.supplies, args.iterations)
+    print(f"{'benchmark':40} {'ops/s':>12} {'mean µs':>10} {'p50 µs':>10} {'p99 µs':>10}")
+    for name, r in results.items():
+        print(f"{name:40} {r['ops']:12.0f} {r['mean_us']:10.2f} {r['p50_us']:10.2f} {r['p99_us']:10.2f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name in regressions:
+            print(f"REGRESSION {name}: {baseline[name]['mean_us']:.2f} -> {results[name]['mean_us']:.2f} µs")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
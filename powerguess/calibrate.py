@@ -0,0 +1,202 @@
+""" record a reference model json for the device this runs on
+
+    python -m powerguess.calibrate --meter rapl --output mydevice.json
+
+the file uses the same idle/avg/load schema as powerguess/models, extra
+utilisation steps are stored under "points", so are steps loading only some
+of the cores, eg. --cores 1,2 adds 1 and 2 cores at every non idle utilisation
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from statistics import mean
+
+import psutil
+
+from powerguess.powerstat import PowerStatReader, POWERSTAT_COMMAND
+from powerguess.rapl import RAPLReader, POWERCAP_ROOT
+from powerguess.utils import get_battery
+
+
+def _burn(duty, stop, period=0.1):
+    # busy loop for `duty` of every period, sleep the rest
+    busy = period * duty
+    while not stop.is_set():
+        start = time.monotonic()
+        while time.monotonic() - start < busy:
+            pass
+        if duty < 1:
+            time.sleep(period - busy)
+
+
+class CPULoad:
+    """ keeps `cores` processes busy for `utilisation` percent of the time """
+
+    def __init__(self, utilisation=100, cores=None):
+        self.duty = max(min(utilisation, 100), 0) / 100
+        self.cores = os.cpu_count() if cores is None else cores
+        self._stop = multiprocessing.Event()
+        self._workers = []
+
+    def __enter__(self):
+        if self.duty:
+            for _ in range(self.cores):
+                w = multiprocessing.Process(target=_burn, args=(self.duty, self._stop), daemon=True)
+                w.start()
+                self._workers.append(w)
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        for w in self._workers:
+            w.join()
+        self._workers = []
+
+
+class RAPLMeter:
+    name = "rapl"
+
+    def __init__(self, root=POWERCAP_ROOT):
+        self.reader = RAPLReader(root)
+
+    @property
+    def available(self):
+        return self.reader.available
+
+    def measure(self, duration):
+        # the counter delta over the whole step is its mean power
+        self.reader.power()
+        time.sleep(duration)
+        return self.reader.power(), 0
+
+
+class PowerStatMeter:
+    name = "powerstat"
+
+    def __init__(self, command=POWERSTAT_COMMAND):
+        self.command = command
+
+    @property
+    def available(self):
+        return bool(shutil.which("powerstat"))
+
+    def measure(self, duration):
+        reader = PowerStatReader(self.command)
+        reader.start()
+        readings = []
+        end = time.monotonic() + duration
+        try:
+            while time.monotonic() < end:
+                try:
+                    readings.append(reader.readings.get(timeout=end - time.monotonic())[1])
+                except Exception:
+                    break
+        finally:
+            reader.stop()
+        return (mean(readings) if readings else None), 0
+
+
+class BatteryMeter:
+    """ battery output, only meaningful while running unplugged """
+    name = "battery"
+
+    @property
+    def available(self):
+        bat = get_battery(ttl=0)
+        return bool(bat and bat["status"] == "Discharging")
+
+    def measure(self, duration):
+        p, v = [], []
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            bat = get_battery(ttl=0)
+            if bat and bat["status"] == "Discharging":
+                p.append(bat["power"])
+                v.append(bat["voltage"])
+            time.sleep(1)
+        return (mean(p) if p else None), (mean(v) if v else 0)
+
+
+METERS = {"rapl": RAPLMeter, "powerstat": PowerStatMeter, "battery": BatteryMeter}
+
+
+def get_meter(name="auto"):
+    if name != "auto":
+        return METERS[name]()
+    for meter in (BatteryMeter, RAPLMeter, PowerStatMeter):
+        m = meter()
+        if m.available:
+            return m
+    raise RuntimeError("no power meter available (battery, rapl or powerstat)")
+
+
+def measure_step(meter, utilisation, duration=30, settle=5, voltage=0, cores=None):
+    """ run a load step on `cores` cores, every core by default, and return a model
+    entry {"cpu", "power", "voltage", "current"}, plus "cores" when given """
+    with CPULoad(utilisation, cores):
+        time.sleep(settle)
+        psutil.cpu_percent()
+        p, v = meter.measure(duration)
+        cpu = psutil.cpu_percent()
+    if p is None:
+        raise RuntimeError(f"{meter.name} returned no readings at {utilisation}% load")
+    v = v or voltage
+    entry = {"cpu": round(cpu, 1), "power": round(p, 3)}
+    if cores is not None:
+        entry["cores"] = cores
+    if v:
+        entry["voltage"] = round(v, 3)
+        entry["current"] = round(p / v, 3)
+    return entry
+
+
+def calibrate(meter, points=(), duration=30, settle=5, voltage=0, cores=()):
+    """ cores: core counts also measured at every non idle utilisation, eg. (1, 2) """
+    steps = {"idle": 0, "avg": 50, "load": 100}
+    model = {}
+    for name, util in steps.items():
+        print(f"measuring {name} ({util}% on every core) with {meter.name}")
+        model[name] = measure_step(meter, util, duration, settle, voltage)
+    utilisations = sorted(set(points) - set(steps.values()))
+    extra = []
+    for u in utilisations:
+        print(f"measuring {u}% on every core with {meter.name}")
+        extra.append(measure_step(meter, u, duration, settle, voltage))
+    # fewer busy cores at the same % is a different load, eg. one thread pinned at 100%
+    for n in sorted(set(cores)):
+        if not 0 < n < os.cpu_count():
+            continue  # every core is already measured above
+        for u in sorted(set(utilisations) | {50, 100}):
+            print(f"measuring {u}% on {n} of {os.cpu_count()} cores with {meter.name}")
+            extra.append(measure_step(meter, u, duration, settle, voltage, cores=n))
+    if extra:
+        model["points"] = extra
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="record a powerguess model json for this device")
+    parser.add_argument("--meter", choices=["auto"] + list(METERS), default="auto")
+    parser.add_argument("--duration", type=float, default=30, help="seconds measured per step")
+    parser.add_argument("--settle", type=float, default=5, help="seconds of load before measuring")
+    parser.add_argument("--points", default="", help="extra utilisation steps, eg. 25,75")
+    parser.add_argument("--cores", default="",
+                        help="also load only this many cores at every non idle step, eg. 1,2")
+    parser.add_argument("--voltage", type=float, default=0,
+                        help="supply voltage, for meters that only report watts")
+    parser.add_argument("--output", default="readings.json")
+    args = parser.parse_args()
+
+    points = [float(p) for p in args.points.split(",") if p.strip()]
+    cores = [int(c) for c in args.cores.split(",") if c.strip()]
+    model = calibrate(get_meter(args.meter), points, args.duration, args.settle, args.voltage, cores)
+    with open(args.output, "w") as f:
+        json.dump(model, f, indent=2)
+    print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
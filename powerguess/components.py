@@ -0,0 +1,164 @@
+""" per-component power terms from kernel counters
+
+aggregate cpu % misses a device that is busy on the radio or the sd card,
+ComponentCounters reads disk, network, memory and cpu frequency residency
+counters once per sample through handles opened at start, ComponentEstimator
+turns their rates into watts with terms from the "components" section of the
+model json, all terms are optional
+
+    "components": {
+        "disk_read": 0.05,      W per MB/s read
+        "disk_write": 0.1,      W per MB/s written
+        "disk_active": 0.1,     W while there is any disk io
+        "net_rx": 0.05,         W per MB/s received
+        "net_tx": 0.1,          W per MB/s sent
+        "net_packets": 0.02,    W per 1000 packets/s
+        "net_active": 0.3,      W while there is any network traffic, eg. wifi leaving power save
+        "mem_pages": 0.01       W per 1000 pages/s allocated, a memory bandwidth proxy
+    }
+"""
+import glob
+import os
+import time
+
+TERMS = ("disk_read", "disk_write", "disk_active", "net_rx", "net_tx", "net_packets",
+         "net_active", "mem_pages")
+_SKIP_BLOCK = ("loop", "ram", "zram", "dm-", "md", "sr", "fd", "nbd")
+_SECTOR = 512  # /proc/diskstats always counts 512 byte sectors
+
+
+class ComponentCounters:
+    """ disk, network, memory and cpu frequency residency rates since the previous sample """
+
+    def __init__(self, proc_root="/proc", sys_root="/sys"):
+        self._diskstats = os.open(f"{proc_root}/diskstats", os.O_RDONLY)
+        self._netdev = os.open(f"{proc_root}/net/dev", os.O_RDONLY)
+        self._vmstat = os.open(f"{proc_root}/vmstat", os.O_RDONLY)
+        # whole disks only, partitions would count the same io twice
+        self.disks = {os.path.basename(d).encode() for d in glob.glob(f"{sys_root}/block/*")
+                      if not os.path.basename(d).startswith(_SKIP_BLOCK)}
+        self._residency = []  # (fd, max freq) per core with cpufreq stats
+        for d in sorted(glob.glob(f"{sys_root}/devices/system/cpu/cpu[0-9]*/cpufreq")):
+            try:
+                with open(f"{d}/cpuinfo_max_freq") as f:
+                    fmax = int(f.read())
+                self._residency.append((os.open(f"{d}/stats/time_in_state", os.O_RDONLY), fmax))
+            except (OSError, ValueError):
+                continue
+        self._prev = None
+        self._prev_t = None
+
+    @staticmethod
+    def _read(fd, size=65536):
+        return os.pread(fd, size, 0)
+
+    def _disk(self):
+        read = written = 0
+        for l in self._read(self._diskstats).split(b"\n"):
+            f = l.split()
+            if len(f) > 9 and f[2] in self.disks:
+                read += int(f[5])
+                written += int(f[9])
+        return read * _SECTOR, written * _SECTOR
+
+    def _net(self):
+        rx = tx = packets = 0
+        for l in self._read(self._netdev).split(b"\n")[2:]:
+            name, _, data = l.partition(b":")
+            if not data or name.strip() == b"lo":
+                continue
+            f = data.split()
+            rx += int(f[0])
+            tx += int(f[8])
+            packets += int(f[1]) + int(f[9])
+        return rx, tx, packets
+
+    def _pages(self):
+        # the pgalloc_<zone> lines are adjacent, only that slice of vmstat is parsed
+        data = self._read(self._vmstat)
+        start = data.find(b"pgalloc_")
+        if start < 0:
+            return 0
+        end = data.find(b"\n", data.rfind(b"pgalloc_"))
+        return sum(int(l.split()[1]) for l in data[start:end].split(b"\n"))
+
+    def _freq(self):
+        # [(freq * time, time)] summed over cores, time_in_state is "<kHz> <10ms units>" per line
+        weighted = total = 0
+        for fd, fmax in self._residency:
+            for l in self._read(fd, 4096).split(b"\n"):
+                f = l.split()
+                if len(f) == 2:
+                    t = int(f[1])
+                    weighted += int(f[0]) / fmax * t
+                    total += t
+        return weighted, total
+
+    def read(self):
+        """ raw cumulative counters, one read of every file """
+        return self._disk() + self._net() + (self._pages(),) + self._freq()
+
+    def sample(self, now=None):
+        """ {"disk_read", "disk_write", "net_rx", "net_tx": bytes/s, "net_packets",
+        "mem_pages": 1/s, "freq": time weighted mean frequency / max, None without cpufreq stats} """
+        now = time.monotonic() if now is None else now
+        cur = self.read()
+        prev, prev_t = self._prev, self._prev_t
+        self._prev, self._prev_t = cur, now
+        if prev is None or now <= prev_t:
+            return dict.fromkeys(("disk_read", "disk_write", "net_rx", "net_tx",
+                                  "net_packets", "mem_pages"), 0.0) | {"freq": None}
+        dt = now - prev_t
+        d = [max(c - p, 0) for c, p in zip(cur, prev)]  # counters reset on hotplug
+        return {"disk_read": d[0] / dt,
+                "disk_write": d[1] / dt,
+                "net_rx": d[2] / dt,
+                "net_tx": d[3] / dt,
+                "net_packets": d[4] / dt,
+                "mem_pages": d[5] / dt,
+                "freq": d[6] / d[7] if d[7] else None}
+
+    def close(self):
+        for fd in [self._diskstats, self._netdev, self._vmstat] + [r[0] for r in self._residency]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._residency = []
+
+
+class ComponentEstimator:
+    """ watts on top of the cpu load curve from the rates of ComponentCounters """
+
+    def __init__(self, terms, counters=None):
+        unknown = set(terms) - set(TERMS)
+        if unknown:
+            print(f"ignoring unknown component terms: {sorted(unknown)}")
+        self.terms = {k: float(v) for k, v in terms.items() if k in TERMS}
+        self.counters = counters or ComponentCounters()
+        self.rates = {}
+        self.breakdown = {}  # W per component of the last sample
+
+    def sample(self, now=None):
+        self.rates = self.counters.sample(now)
+        return self.rates
+
+    def power(self, rates=None):
+        """ W of every component term together """
+        r = self.rates if rates is None else rates
+        t = self.terms
+        disk = r.get("disk_read", 0) + r.get("disk_write", 0)
+        net = r.get("net_rx", 0) + r.get("net_tx", 0)
+        self.breakdown = {
+            "disk": (t.get("disk_read", 0) * r.get("disk_read", 0) / 1e6 +
+                     t.get("disk_write", 0) * r.get("disk_write", 0) / 1e6 +
+                     (t.get("disk_active", 0) if disk else 0)),
+            "network": (t.get("net_rx", 0) * r.get("net_rx", 0) / 1e6 +
+                        t.get("net_tx", 0) * r.get("net_tx", 0) / 1e6 +
+                        t.get("net_packets", 0) * r.get("net_packets", 0) / 1000 +
+                        (t.get("net_active", 0) if net else 0)),
+            "memory": t.get("mem_pages", 0) * r.get("mem_pages", 0) / 1000}
+        return sum(self.breakdown.values())
+
+    def close(self):
+        self.counters.close()
@@ -0,0 +1,129 @@
+""" multi-point load curves compiled into dense lookup tables
+
+a model json is any number of measured points
+
+    {"points": [{"cpu": 25, "freq": 0.6, "power": 3.1, "voltage": 5, "current": 0.62}, ...]}
+
+cpu is the utilisation in %, freq the current/max cpu frequency ratio (1 when
+left out), the old idle/avg/load entries are read as points at 0, 50 and 100 %
+unless they carry their own "cpu", both can be mixed in one file
+
+on load the points are interpolated into a table with one column per 1 % of
+utilisation and one row per 0.05 of frequency, an estimate is a single lookup
+with linear interpolation between two columns
+"""
+from array import array
+
+LEGACY_STEPS = {"idle": 0, "avg": 50, "load": 100}
+COLUMNS = 101  # 0-100 % in 1 % steps
+FREQ_STEP = 0.05
+
+
+def model_points(model):
+    """ [{"cpu", "freq", "power", "voltage", "current"}] from either schema """
+    raw = [dict(model[k], cpu=model[k].get("cpu", u)) for k, u in LEGACY_STEPS.items()
+           if k in model]
+    raw += model.get("points", [])
+    fallback_v = next((p["voltage"] for p in raw if p.get("voltage")), 0)
+    points = []
+    for p in raw:
+        power = p["power"]
+        v = p.get("voltage") or 0
+        i = p.get("current") or 0
+        if i and not v:
+            v = power / i
+        v = v or fallback_v
+        if v and not i:
+            i = power / v
+        points.append({"cpu": float(p["cpu"]), "freq": float(p.get("freq", 1.0)),
+                       "power": power, "voltage": v, "current": i})
+    return points
+
+
+def _interp(xs, ys, x):
+    # piecewise linear, flat outside the measured range
+    if x <= xs[0]:
+        return ys[0]
+    if x >= xs[-1]:
+        return ys[-1]
+    for n in range(1, len(xs)):
+        if x <= xs[n]:
+            x0, x1 = xs[n - 1], xs[n]
+            if x1 == x0:
+                return ys[n]
+            return ys[n - 1] + (ys[n] - ys[n - 1]) * (x - x0) / (x1 - x0)
+    return ys[-1]
+
+
+def _loo_errors(xs, ys):
+    """ leave one out error of every point, how far the curve would be off without it """
+    n = len(xs)
+    if n < 3:
+        return [0.0] * n
+    errs = [abs(ys[k] - _interp(xs[:k] + xs[k + 1:], ys[:k] + ys[k + 1:], xs[k]))
+            for k in range(1, n - 1)]
+    # end points can not be left out without extrapolating, use their neighbour
+    return [errs[0]] + errs + [errs[-1]]
+
+
+class LoadCurve:
+    """ (utilisation, frequency) -> (power, voltage, current, error) """
+
+    def __init__(self, points, error=0.0):
+        """ error: W, measurement uncertainty added to every point, eg. the meter accuracy """
+        if not points:
+            raise ValueError("a load curve needs at least one point")
+        self.points = sorted(points, key=lambda p: (p["freq"], p["cpu"]))
+        freqs = sorted({p["freq"] for p in self.points})
+        self.freq_min, self.freq_max = freqs[0], freqs[-1]
+        self.rows = int(round((self.freq_max - self.freq_min) / FREQ_STEP)) + 1
+
+        # one 1d curve per measured frequency
+        curves = []
+        for f in freqs:
+            pts = [p for p in self.points if p["freq"] == f]
+            xs = [p["cpu"] for p in pts]
+            cols = {}
+            for key in ("power", "voltage", "current"):
+                ys = [p[key] for p in pts]
+                cols[key] = [_interp(xs, ys, u) for u in range(COLUMNS)]
+            errs = _loo_errors(xs, [p["power"] for p in pts])
+            cols["error"] = [_interp(xs, errs, u) + error for u in range(COLUMNS)]
+            curves.append((f, cols))
+
+        self.power = array("d")
+        self.voltage = array("d")
+        self.current = array("d")
+        self.error = array("d")
+        for r in range(self.rows):
+            f = self.freq_min + r * FREQ_STEP
+            for key, table in (("power", self.power), ("voltage", self.voltage),
+                               ("current", self.current), ("error", self.error)):
+                # blend the two measured frequencies around this row
+                fs = [c[0] for c in curves]
+                table.extend(_interp(fs, [c[1][key][u] for c in curves], f)
+                             for u in range(COLUMNS))
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(model_points(model), model.get("error", 0.0))
+
+    def lookup(self, cpu, freq=1.0):
+        """ (p, v, i, error) at `cpu` % utilisation and `freq` of max frequency """
+        u = 0.0 if cpu < 0 else 100.0 if cpu > 100 else float(cpu)
+        k = int(u)
+        frac = u - k
+        if k == COLUMNS - 1:
+            k, frac = k - 1, 1.0
+        if self.rows > 1:
+            f = self.freq_min if freq < self.freq_min else self.freq_max if freq > self.freq_max else freq
+            k += int(round((f - self.freq_min) / FREQ_STEP)) * COLUMNS
+        P, V, I, E = self.power, self.voltage, self.current, self.error
+        return (P[k] + (P[k + 1] - P[k]) * frac,
+                V[k] + (V[k + 1] - V[k]) * frac,
+                I[k] + (I[k + 1] - I[k]) * frac,
+                E[k] + (E[k + 1] - E[k]) * frac)
+
+    @property
+    def idle_power(self):
+        return self.lookup(0, self.freq_min)[0]
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import deque
+
+from powerguess.utils import get_battery
+
+_UNITS = {"mWh": 1000, "Wh": 1, "kWh": 1 / 1000}
+
+
+class BatteryDeltaMonitor(threading.Thread):
+    """ samples battery charge/voltage in the background and keeps the
+    energy rate over the last `window` seconds ready for O(1) reads
+
+    positive rate means the battery is charging, negative discharging
+    """
+
+    def __init__(self, window=60, time_between_measures=2):
+        super().__init__(daemon=True)
+        self.window = window
+        self.time_between_measures = time_between_measures
+        self.running = False
+        # (timestamp, accumulated Wh since first sample)
+        self.samples = deque()
+        self.rate = 0  # Wh/s
+        self._last = None  # (charge, voltage) of the previous sample
+        self._energy = 0
+        self._stop_event = threading.Event()
+
+    def add_sample(self, charge, voltage, timestamp=None):
+        """ charge in Ah, voltage in V """
+        t = time.monotonic() if timestamp is None else timestamp
+        if self._last is not None:
+            c0, v0 = self._last
+            # trapezoid on voltage, charge moved at the mean voltage
+            self._energy += (charge - c0) * (voltage + v0) / 2
+        self._last = charge, voltage
+        self.samples.append((t, self._energy))
+        while len(self.samples) > 2 and t - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+        t0, e0 = self.samples[0]
+        self.rate = (self._energy - e0) / (t - t0) if t > t0 else 0
+
+    def sample(self):
+        bat = get_battery()
+        if bat:
+            self.add_sample(bat["charge"], bat["voltage"])
+
+    def energy_rate(self, unit="mWh"):
+        """ returns (rate, unit), unit one of mWh, Wh, kWh per second """
+        if unit not in _UNITS:
+            unit = "Wh"
+        return self.rate * _UNITS[unit], unit + "/s"
+
+    def run(self) -> None:
+        self.running = True
+        while self.running:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"battery sample failed: {e}")
+            self._stop_event.wait(self.time_between_measures)
+
+    def stop(self):
+        self.running = False
+        self._stop_event.set()
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_delta_monitor():
+    """ shared BatteryDeltaMonitor, started on first use """
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = BatteryDeltaMonitor()
+            _monitor.sample()
+            _monitor.start()
+        return _monitor
@@ -4,25 +4,45 @@ from ovos_PHAL_sensors.device import BaseDevice
 from ovos_PHAL_sensors.sensors.base import _norm
 from ovos_plugin_manager.templates.phal import PHALPlugin
 
-from powerguess.sensors import PowerStatMonitor, PowerGuessPowerSensor, PowerGuessVoltageSensor, \
-    PowerGuessCurrentSensor, BatteryPowerConsumptionSensor, BatteryPowerProductionSensor, BatterySensor, \
+from powerguess.sensors import PowerGuessPowerSensor, PowerGuessVoltageSensor, \
+    PowerGuessCurrentSensor, PowerGuessEnergySensor, BatteryPowerConsumptionSensor, BatteryPowerProductionSensor, BatterySensor, \
     BatteryStatusSensor, BatteryChargingSensor, BatteryEnergyDeltaSensor,\
-    BatteryVoltageSensor, BatteryStoredEnergySensor, BatteryChargeSensor, BatteryCurrentSensor
+    BatteryVoltageSensor, BatteryStoredEnergySensor, BatteryChargeSensor, BatteryCurrentSensor, \
+    BatteryTimeToEmptySensor, BatteryTimeToFullSensor
+from powerguess.guess import PowerStatMonitor
+from powerguess.metrics import metrics
+from powerguess.publish import SensorPublisher
+from powerguess.runtime import get_runtime_predictor
+from powerguess.scheduler import AdaptiveScheduler
+from powerguess.utils import BatterySnapshot
 
 
 class PowerSupplyDevice(BaseDevice):
 
-    def __init__(self):
+    def __init__(self, scheduler=None, publisher=None):
+        self.power = PowerStatMonitor(scheduler=scheduler)
+        super().__init__(_norm("PSU " + self.power.model))
+        self.publisher = publisher or SensorPublisher()
+
+        # sensor instances are built once, the publisher remembers what each one last sent
+        self._sensors = self.build_sensors()
+        for sensor in self._sensors:
+            if self.prefix and sensor._allow_prefix and not sensor.device_name.startswith(f"{self.name}_"):
+                sensor.device_name = f"{self.name}_{sensor.device_name}"
+        self._power_sensors = self._sensors[:4]
+
         def c(reading, model):
-            PowerGuessVoltageSensor().sensor_update()
-            PowerGuessCurrentSensor().sensor_update()
-            PowerGuessPowerSensor().sensor_update()
+            self.publisher.publish(self._power_sensors)
 
-        self.power = PowerStatMonitor()
         self.power.add_callback(c)
+        self.power.add_callback(get_runtime_predictor().callback)
         self.power.start()
 
-        super().__init__(_norm("PSU " + PowerStatMonitor.model))
+    def update(self):
+        # every battery sensor in this tick reads the same sysfs snapshot,
+        # only values past their deadband or max age go out
+        with metrics.timed("device_update"), BatterySnapshot.tick():
+            self.publisher.publish(self._sensors)
 
     def stop(self):
         if self.power:
@@ -30,9 +50,14 @@ class PowerSupplyDevice(BaseDevice):
 
     @property
     def sensors(self):
+        return self._sensors
+
+    @staticmethod
+    def build_sensors():
         return [PowerGuessPowerSensor(),
                 PowerGuessCurrentSensor(),
                 PowerGuessVoltageSensor(),
+                PowerGuessEnergySensor(),
                 BatterySensor(),
                 BatteryChargeSensor(),
                 BatteryCurrentSensor(),
@@ -42,7 +67,9 @@ class PowerSupplyDevice(BaseDevice):
                 BatteryPowerProductionSensor(),
                 BatteryStatusSensor(),
                 BatteryVoltageSensor(),
-                BatteryEnergyDeltaSensor()
+                BatteryEnergyDeltaSensor(),
+                BatteryTimeToEmptySensor(),
+                BatteryTimeToFullSensor()
                 ]
 
 
@@ -61,7 +88,16 @@ class PHALPSU(PHALPlugin):
                                disable_mqtt=self.config.get("disable_mqtt", False),
                                disable_file_logger=self.config.get("disable_filelog", True),
                                mqtt_config=self.config.get("mqtt_config") or {})
-        self.device = PowerSupplyDevice()
+        # {"min_interval": 1, "max_interval": 60, "budget": 0.01, ...}
+        adaptive = self.config.get("adaptive_sampling")
+        if adaptive:
+            scheduler = AdaptiveScheduler(**(adaptive if isinstance(adaptive, dict) else {}))
+        else:
+            scheduler = None
+        publisher = SensorPublisher(max_age=self.config.get("max_age", 300),
+                                    deadbands=self.config.get("deadbands"),
+                                    batch=self.config.get("batch_messages", False))
+        self.device = PowerSupplyDevice(scheduler, publisher)
 
     def run(self):
         self.initialize()
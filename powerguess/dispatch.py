@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+
+from powerguess.metrics import metrics
+
+
+class Subscriber:
+    """ one callback with a single latest reading slot and timing stats """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.pending = None  # args of the latest reading not yet delivered
+        self.scheduled = False  # queued on, or being run by, a worker
+        self.calls = 0
+        self.errors = 0
+        self.drops = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+
+    @property
+    def name(self):
+        return getattr(self.callback, "__qualname__", repr(self.callback))
+
+    @property
+    def stats(self):
+        return {"calls": self.calls,
+                "errors": self.errors,
+                "drops": self.drops,
+                "pending": int(self.pending is not None),
+                "mean_latency": self.total_time / self.calls if self.calls else 0.0,
+                "max_latency": self.max_time,
+                "last_latency": self.last_time}
+
+
+class CallbackDispatcher:
+    """ runs reading callbacks on a worker pool so the sampling thread never waits
+
+    each subscriber holds only the latest reading it has not seen yet, a slow
+    subscriber gets the newest reading when it is done with the previous one
+    and the readings it skipped are counted as drops, a subscriber never runs
+    on two workers at once
+    """
+
+    def __init__(self, workers=2):
+        self.n_workers = workers
+        self.subscribers = {}
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _subscriber(self, cb):
+        sub = self.subscribers.get(cb)
+        if sub is None:
+            sub = self.subscribers[cb] = Subscriber(cb)
+        return sub
+
+    def remove(self, cb):
+        """ forget a callback, a reading it has not started on is dropped """
+        with self._lock:
+            sub = self.subscribers.pop(cb, None)
+            if sub is not None:
+                sub.pending = None
+
+    def _start(self):
+        while len(self._workers) < self.n_workers:
+            w = threading.Thread(target=self._work, daemon=True)
+            w.start()
+            self._workers.append(w)
+
+    def publish(self, callbacks, *args):
+        """ queue cb(*args) for every callback, returns immediately """
+        with self._lock:
+            self._start()
+            for cb in callbacks:
+                sub = self._subscriber(cb)
+                if sub.pending is not None:  # still busy, the older reading is stale
+                    sub.drops += 1
+                    metrics.inc("callback_drops", labels={"callback": sub.name})
+                sub.pending = args
+                if not sub.scheduled:
+                    sub.scheduled = True
+                    self._ready.put(sub)
+
+    def _work(self):
+        while True:
+            sub = self._ready.get()
+            if sub is None:
+                return
+            with self._lock:
+                args, sub.pending = sub.pending, None
+            if args is not None:
+                start = time.perf_counter()
+                try:
+                    sub.callback(*args)
+                except Exception as e:
+                    sub.errors += 1
+                    print(f"callback {sub.callback} failed: {e}")
+                elapsed = time.perf_counter() - start
+                sub.calls += 1
+                sub.total_time += elapsed
+                sub.last_time = elapsed
+                sub.max_time = max(sub.max_time, elapsed)
+                metrics.observe("callback", elapsed, {"callback": sub.name})
+            with self._lock:
+                # one reading per turn, other subscribers get a worker in between
+                if sub.pending is not None:
+                    self._ready.put(sub)
+                else:
+                    sub.scheduled = False
+
+    def stats(self):
+        """ {callback name: {"calls", "errors", "drops", "pending", latencies in seconds}} """
+        return {sub.name: sub.stats for sub in list(self.subscribers.values())}
+
+    def stop(self):
+        with self._lock:
+            for _ in self._workers:
+                self._ready.put(None)
+            self._workers = []
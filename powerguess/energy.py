@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+from powerguess.utils import DATA_DIR
+
+
+class EnergyMeter:
+    """ integrates power readings into a total-increasing energy counter
+
+    uses the trapezoidal rule over real reading timestamps, the running total
+    is appended to a journal every `checkpoint_interval` seconds and the
+    journal is compacted to a single line once it grows past `max_lines`,
+    after a crash at most one checkpoint interval is lost
+    """
+
+    def __init__(self, path=f"{DATA_DIR}/energy.journal", checkpoint_interval=60,
+                 max_lines=1000, max_gap=300, fsync=True):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.max_lines = max_lines
+        self.max_gap = max_gap  # s, longer gaps are not integrated
+        self.fsync = fsync
+        self.total = 0.0  # Wh
+        self._last = None  # (monotonic timestamp, W)
+        self._last_checkpoint = None
+        self._lines = 0
+        self._lock = threading.Lock()
+        if self.path:
+            self.total = self._recover()
+
+    @property
+    def kwh(self):
+        return self.total / 1000
+
+    def _recover(self):
+        # last complete line wins, a torn write at the end is ignored
+        total = 0.0
+        try:
+            with open(self.path) as f:
+                for l in f:
+                    self._lines += 1
+                    if not l.endswith("\n"):
+                        continue
+                    try:
+                        total = float(l.split()[1])
+                    except (IndexError, ValueError):
+                        continue
+        except OSError:
+            pass
+        return total
+
+    def add(self, power, timestamp=None):
+        """ add a reading in W, returns the total in Wh """
+        t = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            if self._last is not None:
+                t0, p0 = self._last
+                dt = t - t0
+                if 0 < dt <= self.max_gap:
+                    self.total += (p0 + power) / 2 * dt / 3600
+            self._last = t, power
+            if self._last_checkpoint is None:
+                self._last_checkpoint = t
+            if self.path and t - self._last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint(t)
+        return self.total
+
+    def _checkpoint(self, t):
+        self._last_checkpoint = t
+        try:
+            if not self._lines or self._lines >= self.max_lines:
+                self._compact()
+                return
+            with open(self.path, "a") as f:
+                f.write(f"{time.time():.3f} {self.total!r}\n")
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._lines += 1
+        except OSError as e:
+            print(f"energy checkpoint failed: {e}")
+
+    def _compact(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{time.time():.3f} {self.total!r}\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._lines = 1
+
+    def checkpoint(self):
+        """ write the current total now, eg. on shutdown """
+        if self.path:
+            with self._lock:
+                self._checkpoint(time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self.total = 0.0
+            self._last = None
+            if self.path:
+                self._compact()
@@ -0,0 +1,191 @@
+import bisect
+from collections import deque
+
+
+class StreamFilter:
+    """ constant time per sample filter, update() returns the filtered value """
+
+    def update(self, x):
+        return x
+
+    def reset(self):
+        pass
+
+
+class MovingAverage(StreamFilter):
+    """ mean of the last n samples, running sum instead of re-averaging the window """
+
+    def __init__(self, n=3):
+        self.n = n
+        self.window = deque()
+        self.total = 0.0
+
+    def update(self, x):
+        self.window.append(x)
+        self.total += x
+        if len(self.window) > self.n:
+            self.total -= self.window.popleft()
+        return self.total / len(self.window)
+
+    def reset(self):
+        self.window.clear()
+        self.total = 0.0
+
+
+class EMA(StreamFilter):
+    """ exponential moving average, higher alpha follows changes faster """
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class MedianFilter(StreamFilter):
+    """ median of the last n samples, rejects single sample spikes """
+
+    def __init__(self, n=5):
+        self.n = n
+        self.window = deque()
+        self.ordered = []
+
+    def update(self, x):
+        self.window.append(x)
+        bisect.insort(self.ordered, x)
+        if len(self.window) > self.n:
+            old = self.window.popleft()
+            del self.ordered[bisect.bisect_left(self.ordered, old)]
+        k = len(self.ordered)
+        if k % 2:
+            return self.ordered[k // 2]
+        return (self.ordered[k // 2 - 1] + self.ordered[k // 2]) / 2
+
+    def reset(self):
+        self.window.clear()
+        self.ordered = []
+
+
+class KalmanFilter(StreamFilter):
+    """ 1-D kalman filter for a slowly varying value
+
+    process_variance is how much the true value moves between samples,
+    measurement_variance how noisy the readings are
+    """
+
+    def __init__(self, process_variance=0.01, measurement_variance=0.25):
+        self.q = process_variance
+        self.r = measurement_variance
+        self.value = None
+        self.p = 1.0
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+            return x
+        self.p += self.q
+        k = self.p / (self.p + self.r)
+        self.value += k * (x - self.value)
+        self.p *= 1 - k
+        return self.value
+
+    def reset(self):
+        self.value = None
+        self.p = 1.0
+
+
+class Deadband(StreamFilter):
+    """ hysteresis, holds the output until the input moves more than `band` away """
+
+    def __init__(self, band=0.1, relative=False):
+        self.band = band
+        self.relative = relative  # band as a fraction of the held value
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+        else:
+            band = self.band * abs(self.value) if self.relative else self.band
+            if abs(x - self.value) > band:
+                self.value = x
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class FilterChain(StreamFilter):
+    """ runs filters in order, eg. median to drop spikes then ema to smooth """
+
+    def __init__(self, *filters):
+        self.filters = filters
+
+    def update(self, x):
+        for f in self.filters:
+            x = f.update(x)
+        return x
+
+    def reset(self):
+        for f in self.filters:
+            f.reset()
+
+
+FILTERS = {
+    "none": StreamFilter,
+    "mean": MovingAverage,
+    "ema": EMA,
+    "median": MedianFilter,
+    "kalman": KalmanFilter,
+    "deadband": Deadband,
+}
+
+
+def make_filter(spec):
+    """ StreamFilter from an instance, a FILTERS name or a {"name": ..., **kwargs} dict """
+    if spec is None:
+        return StreamFilter()
+    if isinstance(spec, StreamFilter):
+        return spec
+    if isinstance(spec, str):
+        return FILTERS[spec]()
+    if isinstance(spec, dict):
+        kwargs = dict(spec)
+        return FILTERS[kwargs.pop("name")](**kwargs)
+    if isinstance(spec, (list, tuple)):
+        return FilterChain(*[make_filter(s) for s in spec])
+    raise ValueError(f"invalid filter: {spec}")
+
+
+class ReadingFilter:
+    """ independent filters for each of the (p, v, i) outputs
+
+    when p is filtered and i is not, i is derived from the filtered p so
+    readings keep p = v * i
+    """
+
+    def __init__(self, p=None, v=None, i=None):
+        self.p = make_filter(p)
+        self.v = make_filter(v)
+        self.i = make_filter(i)
+        self.derive_i = p is not None and i is None
+
+    def update(self, reading):
+        p, v, i = reading
+        p, v = self.p.update(p), self.v.update(v)
+        if self.derive_i:
+            return p, v, p / v if v else i
+        return p, v, self.i.update(i)
+
+    def reset(self):
+        self.p.reset()
+        self.v.reset()
+        self.i.reset()
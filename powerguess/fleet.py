@@ -0,0 +1,237 @@
+""" aggregate readings from many powerguess devices on one collector
+
+devices send compact binary datagrams over udp or a unix datagram socket,
+FleetReporter is a PowerStatMonitor callback that batches and sends them,
+FleetCollector receives and feeds a FleetAggregator that keeps per-device,
+per-model and fleet-wide power and energy totals up to date incrementally,
+any other transport (eg. an mqtt subscriber) can call ingest_packet() directly
+"""
+import os
+import socket
+import struct
+import threading
+import time
+
+MAGIC = b"PGR1"
+_HEADER = struct.Struct("<4sBBH")  # magic, device name len, model len, readings
+_READING = struct.Struct("<dfff")  # t, p, v, i
+MAX_PACKET = 65507
+
+
+def encode_packet(device, model, readings):
+    """ [(t, p, v, i)] from one device into a single datagram """
+    name = device.encode("utf-8")[:255]
+    m = model.encode("utf-8")[:255]
+    readings = readings[:(MAX_PACKET - _HEADER.size - len(name) - len(m)) // _READING.size]
+    return b"".join([_HEADER.pack(MAGIC, len(name), len(m), len(readings)), name, m] +
+                    [_READING.pack(*r) for r in readings])
+
+
+def decode_packet(data):
+    """ (device, model, [(t, p, v, i)]), raises ValueError on malformed packets """
+    if len(data) < _HEADER.size:
+        raise ValueError("packet too short")
+    magic, nlen, mlen, count = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("bad magic")
+    offset = _HEADER.size
+    device = bytes(data[offset:offset + nlen]).decode("utf-8", "replace")
+    offset += nlen
+    model = bytes(data[offset:offset + mlen]).decode("utf-8", "replace")
+    offset += mlen
+    end = offset + count * _READING.size
+    if end > len(data):
+        raise ValueError("truncated packet")
+    return device, model, list(_READING.iter_unpack(data[offset:end]))
+
+
+class DeviceState:
+    """ fixed size per-device state, no history is kept here """
+    __slots__ = ("model", "last_seen", "t", "power", "voltage", "current", "energy", "readings")
+
+    def __init__(self, model):
+        self.model = model
+        self.last_seen = 0.0
+        self.t = None
+        self.power = 0.0  # W
+        self.voltage = 0.0
+        self.current = 0.0
+        self.energy = 0.0  # Wh
+        self.readings = 0
+
+
+class FleetAggregator:
+    """ per-device, per-model and fleet totals, every reading is O(1) """
+
+    def __init__(self, max_gap=300):
+        self.max_gap = max_gap  # s, longer gaps between readings are not integrated
+        self.devices = {}
+        self.model_power = {}  # W, sum of the latest reading of each live device
+        self.model_energy = {}  # Wh, since the collector started
+        self.model_devices = {}
+        self.fleet_power = 0.0
+        self.fleet_energy = 0.0
+        self.readings = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def ingest(self, device, model, readings, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self.devices.get(device)
+            if state is not None and state.model != model:
+                # device was recalibrated / moved to a new model file, start it over
+                self._forget(device, state)
+                state = None
+            if state is None:
+                state = self.devices[device] = DeviceState(model)
+                self.model_devices[model] = self.model_devices.get(model, 0) + 1
+                self.model_power.setdefault(model, 0.0)
+                self.model_energy.setdefault(model, 0.0)
+            old_power = state.power
+            energy = 0.0
+            applied = 0
+            for t, p, v, i in readings:
+                if state.t is not None:
+                    dt = t - state.t
+                    if dt <= 0:
+                        continue  # duplicate or reordered datagram
+                    if dt <= self.max_gap:
+                        energy += (state.power + p) / 2 * dt / 3600
+                state.t, state.power, state.voltage, state.current = t, p, v, i
+                applied += 1
+            state.energy += energy
+            state.readings += applied
+            state.last_seen = now
+            delta = state.power - old_power
+            self.model_power[model] += delta
+            self.fleet_power += delta
+            self.model_energy[model] += energy
+            self.fleet_energy += energy
+            self.readings += applied
+
+    def ingest_packet(self, data, now=None):
+        try:
+            device, model, readings = decode_packet(data)
+        except (ValueError, struct.error):
+            self.errors += 1
+            return
+        self.ingest(device, model, readings, now)
+
+    def _forget(self, device, state):
+        self.devices.pop(device, None)
+        self.model_power[state.model] -= state.power
+        self.fleet_power -= state.power
+        self.model_devices[state.model] -= 1
+        if not self.model_devices[state.model]:
+            self.model_devices.pop(state.model)
+            self.model_power.pop(state.model)
+
+    def evict(self, max_age=300, now=None):
+        """ drop devices not heard from in max_age seconds, energy totals are kept """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            stale = [d for d, s in self.devices.items() if now - s.last_seen > max_age]
+            for d in stale:
+                self._forget(d, self.devices[d])
+        return stale
+
+    def summary(self):
+        with self._lock:
+            return {"devices": len(self.devices),
+                    "readings": self.readings,
+                    "errors": self.errors,
+                    "power": self.fleet_power,
+                    "energy": self.fleet_energy,
+                    "models": {m: {"devices": self.model_devices.get(m, 0),
+                                   "power": self.model_power.get(m, 0.0),
+                                   "energy": e}
+                               for m, e in self.model_energy.items()}}
+
+    def device(self, name):
+        with self._lock:
+            s = self.devices.get(name)
+            if s is None:
+                return None
+            return {"model": s.model, "power": s.power, "voltage": s.voltage,
+                    "current": s.current, "energy": s.energy, "readings": s.readings}
+
+
+class FleetCollector(threading.Thread):
+    """ receives reading datagrams on udp host:port or a unix datagram socket """
+
+    def __init__(self, aggregator=None, host="127.0.0.1", port=9465, unix_socket=None,
+                 evict_after=300):
+        super().__init__(daemon=True)
+        self.aggregator = aggregator or FleetAggregator()
+        self.evict_after = evict_after
+        self.running = False
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(unix_socket)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind((host, port))
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.settimeout(1)
+        self.address = self.sock.getsockname()
+
+    def run(self) -> None:
+        self.running = True
+        buf = bytearray(MAX_PACKET)
+        view = memoryview(buf)
+        ingest = self.aggregator.ingest_packet
+        last_evict = time.monotonic()
+        while self.running:
+            try:
+                n = self.sock.recv_into(buf)
+            except socket.timeout:
+                n = 0
+            except OSError:
+                break
+            if n:
+                ingest(view[:n])
+            now = time.monotonic()
+            if now - last_evict > self.evict_after / 4:
+                self.aggregator.evict(self.evict_after, now)
+                last_evict = now
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+
+class FleetReporter:
+    """ PowerStatMonitor callback batching readings to a FleetCollector
+
+    p = PowerStatMonitor()
+    p.add_callback(FleetReporter("kitchen", ("collector.lan", 9465)).callback)
+    """
+
+    def __init__(self, device, address, batch=10, max_delay=30):
+        self.device = device
+        self.address = address
+        self.batch = batch
+        self.max_delay = max_delay
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.pending = []
+        self._last_send = time.monotonic()
+
+    def callback(self, reading, model):
+        p, v, i = reading
+        self.pending.append((time.time(), p, v, i))
+        if len(self.pending) >= self.batch or time.monotonic() - self._last_send > self.max_delay:
+            self.flush(model)
+
+    def flush(self, model=""):
+        if not self.pending:
+            return
+        try:
+            self.sock.sendto(encode_packet(self.device, model, self.pending), self.address)
+        except OSError as e:
+            print(f"fleet report failed: {e}")
+        self.pending = []
+        self._last_send = time.monotonic()
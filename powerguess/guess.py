@@ -1,68 +1,80 @@
-import json
-import os
-import platform
-import threading
-from distutils.spawn import find_executable
-from itertools import islice
-from statistics import mean
+import queue
+import shutil
 
-import pexpect
-import psutil
+from powerguess.metrics import metrics
+from powerguess.monitor import PowerMonitor, Sample
+from powerguess.powerstat import PowerStatReader, POWERSTAT_COMMAND
+from powerguess.rapl import RAPLReader, POWERCAP_ROOT
+from powerguess.sources import GuessSource, BatterySource
+from powerguess.utils import get_battery
 
-from powerguess.utils import get_battery_info, get_model, transform_range
 
+class PowerStatMonitor(PowerMonitor):
+    """ best available source for the whole device: battery, RAPL, powerstat or the estimate
 
-class PowerStatMonitor(threading.Thread):
-    running = False
-    current_value = 0, 0, 0  # (p, v, i)
+    class attributes are defaults, every instance owns its own state,
+    callbacks, model and benchmarks
+    """
     prefer_battery = False
-    disable_powerstat = find_executable("powerstat")
-    model = get_model()
-    benchmarks = {}
-    callbacks = []
-
-    def __init__(self, smooth=False, time_between_measures=5):
-        super().__init__(daemon=True)
+    disable_powerstat = False
+    disable_rapl = False
+    rapl_root = POWERCAP_ROOT
+    powerstat_command = POWERSTAT_COMMAND
+    track_energy = True
+    keep_history = True
+    _powerstat_path = None  # probed on first use
+
+    def __init__(self, smooth=False, time_between_measures=5, filters=None, name="default",
+                 model=None, cpu_source=None, register=True, scheduler=None,
+                 track_energy=None, keep_history=None):
+        """ smooth=True is a 3 sample moving average on power, see PowerMonitor for filters
+
+        track_energy / keep_history default to the class attributes """
+        if filters is None and smooth:
+            filters = {"p": {"name": "mean", "n": 3}}
+        self.guess = GuessSource(model, cpu_source)
+        self.battery_source = BatterySource()
+        super().__init__(self.guess, name, time_between_measures, filters,
+                         track_energy=self.track_energy if track_energy is None else track_energy,
+                         keep_history=self.keep_history if keep_history is None else keep_history,
+                         register=register, scheduler=scheduler)
         self.smooth = smooth
-        self.time_between_measures = time_between_measures
-        self.readings = []
+        self.powerstat = None
+        self.rapl = None
         self.has_battery = bool(self.get_battery())
         if self.model:
             self.set_model(self.model)
 
-    @classmethod
-    def set_model(cls, model):
-        cls.model = model
-        if "Raspberry Pi 4" in cls.model:
-            m = "pi4.json"
-        elif "Raspberry Pi 3 Model B Plus" in cls.model:
-            m = "pi3b+.json"
-        elif "Raspberry Pi 3" in cls.model:
-            m = "pi3b.json"
-        elif "Raspberry Pi 2" in cls.model:
-            m = "pi2.json"
-        elif "Raspberry Pi Zero" in cls.model:
-            m = "pi0.json"
-        elif "U500-H" in model:
-            m = "minipc_generic.json"
-        # catch all - generic laptop
-        elif platform.machine() == "x86_64" and list(get_battery_info()):
-            m = "laptop_generic.json"
-        # catch all - sbc
-        elif platform.machine() == "aarch64" or "Raspberry Pi" in model:
-            m = "sbc_generic.json"
-        # catch all - PC
-        else:
-            m = "pc_generic.json"
+    @property
+    def benchmarks(self):
+        return self.guess.benchmarks
 
-        with open(f"{os.path.dirname(__file__)}/models/{m}") as f:
-            PowerStatMonitor.benchmarks = json.load(f)
+    @property
+    def learned(self):
+        return self.guess.learned
 
-        PowerStatMonitor.current_value = cls.guesstimate()
+    @property
+    def estimate_error(self):
+        """ W, error bound of the last estimate, 0 for measured readings """
+        return self.guess.last_error
+
+    @staticmethod
+    def select_benchmark(model):
+        return GuessSource.select_benchmark(model)
+
+    def set_model(self, model):
+        self.guess.set_model(model)
+        self.current_value = self.guesstimate()
+
+    def enable_learning(self, path=None):
+        """ see GuessSource.enable_learning """
+        return self.guess.enable_learning(path)
 
     @classmethod
-    def add_callback(cls, cb):
-        PowerStatMonitor.callbacks.append(cb)
+    def has_powerstat(cls):
+        if cls._powerstat_path is None:
+            cls._powerstat_path = shutil.which("powerstat") or ""
+        return bool(cls._powerstat_path)
 
     @property
     def battery(self):
@@ -70,147 +82,117 @@ class PowerStatMonitor(threading.Thread):
             return self.get_battery()
         return {}
 
-    @classmethod
-    def get_battery_consumption(cls):
+    def get_battery_consumption(self):
         # energy being consumed in addition to energy from laptop
-        bat = cls.get_battery()
-        if bat:
-            if bat["status"] == "Charging":
-                p = bat["power"]
-                v = bat["voltage"]
-                i = bat["current"]
-                return p, v, i
-        return 0, 0, 0
+        return self.battery_source.consumption()
 
-    @classmethod
-    def get_battery_output(cls):
+    def get_battery_output(self):
         # energy being provided to laptop
-        bat = cls.get_battery()
-        if bat:
-            if bat["status"] == "Discharging":
-                p = bat["power"]
-                v = bat["voltage"]
-                i = bat["current"]
-                return p, v, i
-        return 0, 0, 0
-
-    def run(self) -> None:
-        PowerStatMonitor.running = True
-        while PowerStatMonitor.running:
-            for reading in self.measure_powerstat(self.smooth):
-                if not reading[0]:
-                    continue  # 0 power consumption is impossible
-                PowerStatMonitor.current_value = reading
-                for cb in self.callbacks:
-                    try:
-                        cb(reading, self.model)
-                    except Exception as e:
-                        print(f"callback {cb} failed: {e}")
-                        continue
-            threading.Event().wait(self.time_between_measures)
+        return self.battery_source.output()
 
-    def stop(self):
-        PowerStatMonitor.running = False
+    @property
+    def self_paced(self):
+        # powerstat readings pace themselves
+        return bool(self.powerstat) and not (self.rapl and self.rapl.available)
 
-    @staticmethod
-    def _window(iterable, n=2):
-        # window('123', 2) --> '12' '23'
-        args = [islice(iterable, i, None) for i in range(n)]
-        return zip(*args)
+    def measure(self):
+        return self.measure_powerstat()
 
-    @classmethod
-    def get_battery(cls):
-        bat = list(get_battery_info())
-        if bat:  # estimate from battery readings
-            bat = bat[0]
-        return bat or None
+    def stop(self):
+        super().stop()
+        if self.powerstat:
+            self.powerstat.stop()
+        if self.rapl:
+            self.rapl.close()
 
-    @classmethod
-    def guesstimate(cls):
+    @staticmethod
+    def get_battery():
+        return get_battery()
 
+    def guesstimate(self):
         # assume battery output == total laptop input
-        p, v, i = cls.get_battery_output()
+        p, v, i = self.get_battery_output()
         if p:
             return p, v, i
+        return self.guess.estimate()
 
-        # estimate consumption based on cpu usage
-        cpu = psutil.cpu_percent()
-
-        pmax = cls.benchmarks["load"]["power"]
-        pmin = cls.benchmarks["idle"]["power"]
-        pavg = cls.benchmarks["avg"]["power"]
-        imax = cls.benchmarks["load"].get("current") or 0
-        iavg = cls.benchmarks["avg"].get("current") or imax * 0.6
-        imin = cls.benchmarks["idle"].get("current") or imax * 0.3
-        i, v, p = 0, 0, 0
-
-        if cpu < 60:
-            p = transform_range(cpu, (0, 100), (pmin, pavg))
-            if imin and iavg:
-                i = transform_range(cpu, (0, 100), (imin, iavg))
-            else:
-                v = cls.benchmarks["avg"].get("voltage") or \
-                    cls.benchmarks["load"].get("voltage") or \
-                    cls.benchmarks["idle"].get("voltage") or 0
-        else:
-            p = transform_range(cpu, (0, 100), (pmin, pmax))
-            if imin and imax:
-                i = transform_range(cpu, (0, 100), (imin, imax))
-            else:
-                v = cls.benchmarks["load"].get("voltage") or \
-                    cls.benchmarks["avg"].get("voltage") or \
-                    cls.benchmarks["idle"].get("voltage") or 0
-
-        if i and not v:
-            v = p / i  # V
-        if v and not i:
-            i = p / v  # A
-
-        return p, v, i
+    def _process_reading(self, p, v, pb=0, t=None):
+        # measured watts -> (p, v, i), what goes into charging the battery is
+        # added after filtering so smoothing only sees the measured signal
+        return Sample((p, v, p / v if v else 0), t, (pb, pb / v if v else 0))
 
     def measure_powerstat(self, smooth=False):
+        # smooth is kept for compatibility, run() applies self.filters to every backend
+        # learned features are sampled once per tick, by the estimate or right before learn()
         if self.prefer_battery and self.has_battery:
             # assume battery output == total laptop input
             p, v, i = self.get_battery_output()
             if p:
+                if self.learned:
+                    self.learned.sample()
+                    self.learned.learn(p)
                 yield p, v, i
                 return
 
-        # consumption from cpu
-        p, v, i = self.guesstimate()
+        # consumption from cpu, the battery output while discharging
+        with metrics.timed("guesstimate"):
+            p, v, i = self.get_battery_output()
+            discharging = bool(p)
+            if not discharging:
+                p, v, i = self.guess.estimate()
+
+        # the learned model gets one ground truth per tick, the whole system
+        # battery output while discharging, else the RAPL / powerstat reading,
+        # fitting both would converge to neither
+        learner = self.learned if self.learned and not discharging else None
+        if discharging and self.learned:
+            self.learned.sample()  # no estimate ran this tick
+            self.learned.learn(p)
 
         # consumption from charging
         pb, vb, ib = self.get_battery_consumption()
 
+        # consumption from RAPL energy counters, no sudo or subprocess needed
+        if not self.disable_rapl:
+            if self.rapl is None:
+                self.rapl = RAPLReader(self.rapl_root)
+                self.rapl.power()  # first sample only primes the counters
+            if self.rapl.available:
+                with metrics.timed("rapl_read"):
+                    pr = self.rapl.power()
+                if pr is None:
+                    yield Sample((p, v, i), None, (pb, ib))
+                else:
+                    if learner:
+                        learner.learn(pr)
+                    yield self._process_reading(pr, v, pb)
+                return
+
         # consumption from powerstat
         # ALL ALL=NOPASSWD: /usr/bin/powerstat
-        if not self.disable_powerstat and find_executable("powerstat"):
+        if not self.disable_powerstat and self.has_powerstat():
+            if not self.powerstat:
+                self.powerstat = PowerStatReader(self.powerstat_command)
+                self.powerstat.start()
             try:
-                child = pexpect.spawn('sudo powerstat -R 1')
-                child.expect('  Time    User  Nice   Sys  Idle    IO  Run Ctxt/s  IRQ/s Fork Exec Exit  Watts\r\n')
-                while True:
-                    l = [_ for _ in child.readline(1).decode("utf-8").strip().split(" ") if _.strip()]
-                    if len(l) != 13 or l[0] == '--------':
-                        break
-                    try:
-                        p = float(l[-1])
-                    except:
-                        break
-                    self.readings.append(p)
-                    if smooth:
-                        avg = [mean(w) for w in self._window(self.readings, 3)]
-                        if avg:
-                            p = avg[-1]
-                    p += pb
-                    i = p / v
-                    yield p, v, i
-                    if len(self.readings) > 10:
-                        self.readings = self.readings[-10:]
-                child.terminate(True)
-            except Exception as e:
-                print(e)
+                t, p = self.powerstat.readings.get(timeout=self.time_between_measures)
+            except queue.Empty:
+                # powerstat (re)starting, keep reporting the estimate
+                yield Sample((p, v, i), None, (pb, ib))
+                return
+            # a backlog keeps its sample times, energy is integrated over when they were taken
+            readings = [(t, p)]
+            while True:
+                try:
+                    readings.append(self.powerstat.readings.get_nowait())
+                except queue.Empty:
+                    break
+            if learner:
+                learner.learn(readings[-1][1])  # the freshest one
+            for t, p in readings:
+                yield self._process_reading(p, v, pb, t)
         else:
-            yield p + pb, v, i + ib
+            yield Sample((p, v, i), None, (pb, ib))
 
 
 if __name__ == "__main__":
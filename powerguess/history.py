@@ -0,0 +1,166 @@
+import threading
+import time
+from array import array
+
+FIELDS = ("t", "p", "v", "i", "p_min", "p_max", "n")  # n: readings averaged into the record
+
+# (seconds per record, records kept) -> 1s for an hour, 1min for a day, 1h for a year
+DEFAULT_TIERS = ((1, 3600), (60, 1440), (3600, 8760))
+
+
+class RingBuffer:
+    """ fixed size columnar buffer of FIELDS, oldest records are overwritten """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = {f: array("d", bytes(8 * capacity)) for f in FIELDS}
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, values):
+        idx = (self.start + self.count) % self.capacity
+        for f, v in zip(FIELDS, values):
+            self.columns[f][idx] = v
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def _at(self, field, k):
+        return self.columns[field][(self.start + k) % self.capacity]
+
+    def bisect(self, t):
+        """ logical index of the first record with timestamp >= t """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._at("t", mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def column(self, field, lo=0, hi=None):
+        hi = self.count if hi is None else hi
+        col = self.columns[field]
+        a = (self.start + lo) % self.capacity
+        b = (self.start + hi) % self.capacity
+        if hi - lo <= 0:
+            return []
+        if a < b:
+            return col[a:b].tolist()
+        return col[a:].tolist() + col[:b].tolist()
+
+    @property
+    def oldest(self):
+        return self._at("t", 0) if self.count else None
+
+
+class _Tier:
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.buffer = RingBuffer(capacity)
+        self._bucket = None
+        self._acc = None  # [t, sum p, sum v, sum i, min p, max p, n]
+
+    def add(self, t, p, v, i, p_min, p_max):
+        bucket = int(t // self.resolution)
+        if bucket != self._bucket:
+            self.flush()
+            self._bucket = bucket
+            self._acc = [t, 0.0, 0.0, 0.0, p_min, p_max, 0]
+        acc = self._acc
+        acc[1] += p
+        acc[2] += v
+        acc[3] += i
+        acc[4] = min(acc[4], p_min)
+        acc[5] = max(acc[5], p_max)
+        acc[6] += 1
+
+    def flush(self):
+        acc = self._acc
+        if acc is None:
+            return
+        n = acc[6]
+        self.buffer.append((acc[0], acc[1] / n, acc[2] / n, acc[3] / n, acc[4], acc[5], n))
+        self._acc = None
+
+
+def _percentile(values, q):
+    # values must be sorted, linear interpolation between closest ranks
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q / 100
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+class PowerHistory:
+    """ (t, p, v, i) readings in fixed memory, downsampled into coarser tiers as they age
+
+    each tier keeps the mean p/v/i per bucket plus the min/max power seen in it
+    and how many readings went into it, means across buckets are weighted by
+    that count so a sparse bucket does not count as much as a full one,
+    queries use the finest tier that still covers the requested start time
+    """
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.tiers = [_Tier(res, cap) for res, cap in tiers]
+        self._lock = threading.Lock()
+
+    def add(self, p, v, i, timestamp=None):
+        t = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for tier in self.tiers:
+                tier.add(t, p, v, i, p, p)
+
+    def _tier_for(self, start):
+        for tier in self.tiers:
+            oldest = tier.buffer.oldest
+            if oldest is not None and oldest <= start:
+                return tier
+        # nothing reaches that far back, coarsest tier has the most history
+        candidates = [t for t in self.tiers if len(t.buffer)]
+        return min(candidates, key=lambda t: t.buffer.oldest) if candidates else self.tiers[0]
+
+    def query(self, start, end=None, field="p"):
+        """ [(t, value)] between start and end (wall clock seconds) """
+        end = time.time() if end is None else end
+        with self._lock:
+            buf = self._tier_for(start).buffer
+            lo, hi = buf.bisect(start), buf.bisect(end + 1e-9)
+            return list(zip(buf.column("t", lo, hi), buf.column(field, lo, hi)))
+
+    def stats(self, start, end=None, field="p", percentiles=(50, 90, 99)):
+        """ {"count", "min", "max", "mean", "p50", ...} of field between start and end """
+        end = time.time() if end is None else end
+        with self._lock:
+            buf = self._tier_for(start).buffer
+            lo, hi = buf.bisect(start), buf.bisect(end + 1e-9)
+            values = buf.column(field, lo, hi)
+            weights = buf.column("n", lo, hi)
+            if field == "p":
+                lows, highs = buf.column("p_min", lo, hi), buf.column("p_max", lo, hi)
+            else:
+                lows = highs = values
+        if not values:
+            return {"count": 0}
+        ordered = sorted(values)
+        s = {"count": len(values),
+             "min": min(lows),
+             "max": max(highs),
+             "mean": sum(x * w for x, w in zip(values, weights)) / sum(weights)}
+        for q in percentiles:
+            s[f"p{q}"] = _percentile(ordered, q)
+        return s
+
+    def last(self, seconds, field="p"):
+        return self.query(time.time() - seconds, field=field)
+
+    @property
+    def nbytes(self):
+        return sum(len(c) * c.itemsize for t in self.tiers for c in t.buffer.columns.values())
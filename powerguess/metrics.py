@@ -0,0 +1,184 @@
+""" self-overhead instrumentation, off by default
+
+    from powerguess.metrics import serve_metrics
+    serve_metrics(port=9464)  # or serve_metrics(unix_socket="/run/powerguess.sock")
+
+exposes counters, latency histograms and the cpu/memory used by this process
+in prometheus text format, when disabled every hook is a single attribute check
+"""
+import bisect
+import os
+import resource
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# seconds, from 10µs up to 10s
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.labels)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _key(name, labels):
+    if not labels:
+        return name, ""
+    return name, ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+
+class Metrics:
+    """ counters and latency histograms keyed by name and optional labels """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, labels=None):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=None):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram()
+            h.observe(seconds)
+
+    def timed(self, name, labels=None):
+        """ with metrics.timed("guesstimate"): ... """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    @staticmethod
+    def process_stats():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        stats = {"process_cpu_seconds_total": usage.ru_utime + usage.ru_stime,
+                 "process_threads": threading.active_count()}
+        try:
+            with open("/proc/self/statm") as f:
+                stats["process_resident_memory_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            pass
+        return stats
+
+    def render(self, prefix="powerguess_"):
+        """ prometheus text exposition format """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                seen.add(name)
+            lines.append(f"{prefix}{name}_total{{{labels}}} {value}" if labels
+                         else f"{prefix}{name}_total {value}")
+        for (name, labels), h in histograms:
+            metric = f"{prefix}{name}_seconds"
+            if name not in seen:
+                lines.append(f"# TYPE {metric} histogram")
+                seen.add(name)
+            sep = "," if labels else ""
+            cumulative = 0
+            for le, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{metric}_sum{suffix} {h.sum}")
+            lines.append(f"{metric}_count{suffix} {h.count}")
+        for name, value in self.process_stats().items():
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# TYPE {prefix}{name} {kind}")
+            lines.append(f"{prefix}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address)
+
+    def log_message(self, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_metrics(port=9464, host="127.0.0.1", unix_socket=None):
+    """ enable metrics and serve them over http on a local port or unix socket """
+    metrics.enabled = True
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = _UnixHTTPServer(unix_socket, _Handler)
+    else:
+        server = HTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import namedtuple
+
+from powerguess.dispatch import CallbackDispatcher
+from powerguess.energy import EnergyMeter
+from powerguess.filters import ReadingFilter
+from powerguess.history import PowerHistory
+from powerguess.metrics import metrics
+from powerguess.utils import DATA_DIR
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+# what measure() yields instead of a bare (p, v, i) when there is more to it,
+# timestamp: unix time of the sample when known, eg. backlogged powerstat samples,
+# base: (p, i) added after filtering, eg. what goes into charging the battery
+Sample = namedtuple("Sample", ("reading", "timestamp", "base"), defaults=(None, None))
+
+
+def register_monitor(name, monitor):
+    with _monitors_lock:
+        _monitors[name] = monitor
+
+
+def unregister_monitor(name, monitor=None):
+    with _monitors_lock:
+        if monitor is None or _monitors.get(name) is monitor:
+            _monitors.pop(name, None)
+
+
+def get_monitor(name="default"):
+    """ running monitor registered under name, None if there is none """
+    return _monitors.get(name)
+
+
+def list_monitors():
+    return dict(_monitors)
+
+
+class PowerMonitor(threading.Thread):
+    """ samples one source at its own rate, all state belongs to the instance
+
+    fast = PowerMonitor(RAPLSource(), name="rapl", time_between_measures=0.1)
+    slow = PowerMonitor(BatterySource(), name="battery", time_between_measures=30)
+    """
+
+    def __init__(self, source, name=None, time_between_measures=None, filters=None,
+                 track_energy=False, keep_history=False, register=True, scheduler=None):
+        """ filters: {"p": ..., "v": ..., "i": ...} with a StreamFilter, a name
+        from powerguess.filters.FILTERS or a {"name": ..., **kwargs} dict per output
+
+        scheduler: an AdaptiveScheduler replacing the fixed time_between_measures """
+        super().__init__(daemon=True)
+        self.source = source
+        self.name = name or source.name
+        self.time_between_measures = source.interval if time_between_measures is None \
+            else time_between_measures
+        self.filters = ReadingFilter(**(filters or {}))
+        self.scheduler = scheduler
+        self.running = False
+        self.current_value = 0, 0, 0  # (p, v, i)
+        self.callbacks = []
+        self.dispatcher = CallbackDispatcher()  # runs callbacks off the sampling thread
+        self.energy_meter = None
+        self.history = None
+        if track_energy:
+            journal = "energy.journal" if self.name == "default" else f"{self.name}.energy.journal"
+            self.energy_meter = EnergyMeter(f"{DATA_DIR}/{journal}")
+        if keep_history:
+            self.history = PowerHistory()
+        self._stop_event = threading.Event()
+        if register:
+            register_monitor(self.name, self)
+
+    @property
+    def model(self):
+        return self.source.model
+
+    @property
+    def self_paced(self):
+        """ True if measure() blocks until the next reading, no wait in between """
+        return self.source.streaming
+
+    def add_callback(self, cb):
+        self.callbacks.append(cb)
+
+    def remove_callback(self, cb):
+        if cb in self.callbacks:
+            self.callbacks.remove(cb)
+        self.dispatcher.remove(cb)
+
+    def measure(self):
+        reading = self.source.read(timeout=self.time_between_measures)
+        if reading:
+            yield reading
+
+    def on_reading(self, reading, timestamp=None, base=None):
+        """ reading: (p, v, i), timestamp: unix time it was sampled, now by default,
+        base: (p, i) added to the filtered reading, filters only see what was measured """
+        if not reading[0] and not (base and base[0]):
+            return  # 0 power consumption is impossible
+        metrics.inc("readings", labels={"monitor": self.name})
+        reading = self.filters.update(reading)
+        if base:
+            p, v, i = reading
+            reading = p + base[0], v, i + base[1]
+        self.current_value = reading
+        now = time.time()
+        t = now if timestamp is None else timestamp
+        if self.energy_meter:
+            # the meter runs on the monotonic clock, the sample time is shifted onto it
+            self.energy_meter.add(reading[0], timestamp=time.monotonic() - (now - t))
+        if self.history:
+            self.history.add(*reading, timestamp=t)
+        self.dispatcher.publish(self.callbacks, reading, self.model)
+
+    def run(self) -> None:
+        self.running = True
+        while self.running:
+            start = time.perf_counter()
+            try:
+                for reading in self.measure():
+                    if isinstance(reading, Sample):
+                        self.on_reading(*reading)
+                    else:
+                        self.on_reading(reading)
+            except Exception as e:
+                print(f"{self.name} measure failed: {e}")
+            if self.self_paced:
+                continue
+            if self.scheduler:
+                self.scheduler.measured(time.perf_counter() - start, self.current_value[0])
+                self.scheduler.wait(self._stop_event)
+            else:
+                self._stop_event.wait(self.time_between_measures)
+
+    def stop(self):
+        self.running = False
+        self._stop_event.set()
+        self.source.close()
+        if self.energy_meter:
+            self.energy_meter.checkpoint()
+        self.dispatcher.stop()
+        unregister_monitor(self.name, self)
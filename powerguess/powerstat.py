@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+
+import pexpect
+
+from powerguess.metrics import metrics
+
+# ALL ALL=NOPASSWD: /usr/bin/powerstat
+# -R reads RAPL, 1 second interval, enough samples to run for a day before
+# powerstat prints its summary and exits (the reader then restarts it)
+POWERSTAT_COMMAND = "sudo powerstat -R 1 86400"
+
+
+def parse_powerstat_line(line):
+    """ watts from a powerstat sample line, None for headers, summaries and noise
+
+      Time    User  Nice   Sys  Idle    IO  Run Ctxt/s  IRQ/s Fork Exec Exit  Watts
+    12:00:01   1.0   0.0   0.5  98.5   0.0    1    512    230    0    0    0   4.21
+    """
+    fields = line.split()
+    if len(fields) != 13 or fields[0].count(":") != 2:
+        return None
+    try:
+        return float(fields[-1])
+    except ValueError:
+        return None
+
+
+class PowerStatReader(threading.Thread):
+    """ keeps a single powerstat process alive and parses its output as it streams
+
+    every sample is put in `readings` as (timestamp, watts), if powerstat
+    exits it is restarted with exponential backoff
+    """
+
+    def __init__(self, command=POWERSTAT_COMMAND, min_backoff=1, max_backoff=60, maxsize=120):
+        super().__init__(daemon=True)
+        self.command = command
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.readings = queue.Queue(maxsize=maxsize)
+        self.latest = None  # (timestamp, watts)
+        self.restarts = 0
+        self.running = False
+        self._child = None
+        self._stop_event = threading.Event()
+
+    def _push(self, reading):
+        while True:
+            try:
+                self.readings.put_nowait(reading)
+                return
+            except queue.Full:  # nobody is consuming, keep the newest
+                try:
+                    self.readings.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _stream(self):
+        """ read one powerstat process until it exits, returns number of samples """
+        n = 0
+        with metrics.timed("powerstat_spawn"):
+            self._child = pexpect.spawn(self.command, encoding="utf-8", timeout=None)
+        try:
+            while self.running:
+                line = self._child.readline()
+                if not line:  # EOF
+                    break
+                watts = parse_powerstat_line(line)
+                if watts is None:
+                    continue
+                self.latest = time.time(), watts
+                self._push(self.latest)
+                n += 1
+                metrics.inc("powerstat_samples")
+        finally:
+            self._child.close(force=True)
+            self._child = None
+        return n
+
+    def run(self) -> None:
+        self.running = True
+        backoff = self.min_backoff
+        while self.running:
+            try:
+                if self._stream():
+                    backoff = self.min_backoff
+                else:
+                    backoff = min(backoff * 2, self.max_backoff)
+            except Exception as e:
+                print(f"powerstat failed: {e}")
+                backoff = min(backoff * 2, self.max_backoff)
+            if not self.running:
+                break
+            self.restarts += 1
+            metrics.inc("powerstat_restarts")
+            self._stop_event.wait(backoff)
+
+    def stop(self):
+        self.running = False
+        self._stop_event.set()
+        child = self._child
+        if child is not None:
+            try:
+                child.terminate(force=True)
+            except Exception:
+                pass
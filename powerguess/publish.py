@@ -0,0 +1,135 @@
+""" change driven sensor publishing
+
+every sensor value is compared with the last one published for it, only values
+that moved past the sensor deadband, or were last published more than `max_age`
+seconds ago, go out, on the messagebus every changed sensor is sent as the
+usual "ovos.phal.sensor" message, or with `batch=True` the whole tick as one
+"ovos.phal.sensor.batch" message
+
+like BaseDevice.update, `_once` sensors are read once, `_slow` ones every 15
+minutes, and a sensor that fails 3 reads in a row is disabled
+"""
+import threading
+import time
+
+from ovos_bus_client.message import Message
+from ovos_PHAL_sensors.loggers import MessageBusLogger
+from ovos_PHAL_sensors.sensors.base import Sensor, BooleanSensor, _norm
+
+from powerguess.metrics import metrics
+
+
+class SensorPublisher:
+    """ keeps the last published value per sensor and publishes only what changed
+
+    deadbands: {sensor_id: deadband} overriding the `deadband` class attribute of
+    the sensors, sensor_id is "<device_name>_<unique_id>" as on the messagebus
+    """
+    batch_message = "ovos.phal.sensor.batch"
+    slow_interval = 15 * 60  # s, between reads of `_slow` sensors
+    max_failures = 3  # consecutive failed reads before a sensor is disabled
+
+    def __init__(self, max_age=300, deadbands=None, batch=False):
+        self.max_age = max_age  # s, heartbeat for values that did not change
+        self.deadbands = deadbands or {}
+        self.batch = batch  # one batch message per tick instead of one message per sensor
+        self.disabled = set()  # sensor ids that kept failing
+        self._published = {}  # sensor_id: (value, monotonic time)
+        self._read_ts = {}  # sensor_id: monotonic time of the last successful read
+        self._failures = {}  # sensor_id: consecutive failed reads
+        self._ids = {}  # (device_name, unique_id): sensor_id
+        self._lock = threading.Lock()
+
+    def sensor_id(self, sensor):
+        key = sensor.device_name, sensor.unique_id
+        if key not in self._ids:
+            self._ids[key] = f"{_norm(sensor.device_name)}_{_norm(sensor.unique_id)}"
+        return self._ids[key]
+
+    def deadband(self, sensor, sensor_id=None):
+        return self.deadbands.get(sensor_id or self.sensor_id(sensor),
+                                  getattr(sensor, "deadband", 0))
+
+    def due(self, sensor_id, value, deadband, now):
+        if sensor_id not in self._published:
+            return True
+        last, ts = self._published[sensor_id]
+        if now - ts >= self.max_age:
+            return True
+        if isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and isinstance(last, (int, float)) and deadband:
+            return abs(value - last) > deadband
+        return value != last
+
+    def read(self, sensor, sensor_id, now):
+        """ (True, value), or (False, None) when the sensor is skipped this tick or failed """
+        if sensor_id in self.disabled:
+            return False, None
+        last = self._read_ts.get(sensor_id)
+        if last is not None and (sensor._once or
+                                 (sensor._slow and now - last < self.slow_interval)):
+            return False, None
+        try:
+            value = sensor.value
+        except Exception as e:
+            fails = self._failures.get(sensor_id, 0) + 1
+            self._failures[sensor_id] = fails
+            print(f"sensor {sensor_id} failed: {e}")
+            if fails >= self.max_failures:
+                self.disabled.add(sensor_id)
+                print(f"sensor {sensor_id} failed {fails} times in a row, "
+                      f"disabling it for the rest of this run")
+            return False, None
+        self._failures[sensor_id] = 0
+        self._read_ts[sensor_id] = now
+        return True, value
+
+    def select(self, sensors, now=None):
+        """ [(sensor, value)] that should be published now, marks them as published """
+        now = time.monotonic() if now is None else now
+        changed = []
+        with self._lock:
+            for sensor in sensors:
+                sid = self.sensor_id(sensor)
+                ok, value = self.read(sensor, sid, now)
+                if ok and self.due(sid, value, self.deadband(sensor, sid), now):
+                    self._published[sid] = (value, now)
+                    changed.append((sensor, value))
+        return changed
+
+    def publish(self, sensors, now=None):
+        """ send the sensors that changed to every bound logger, returns them """
+        changed = self.select(sensors, now)
+        metrics.inc("sensor_updates_skipped", len(sensors) - len(changed))
+        if not changed:
+            return changed
+        metrics.inc("sensor_updates_published", len(changed))
+        for logger in Sensor.loggers:
+            if logger is MessageBusLogger and self.batch:
+                continue
+            for sensor, value in changed:
+                try:
+                    if isinstance(sensor, BooleanSensor):
+                        logger.binary_sensor_update(sensor)
+                    else:
+                        logger.sensor_update(sensor)
+                except Exception as e:
+                    print(f"{logger.__name__} update failed for {sensor.unique_id}: {e}")
+        if self.batch and MessageBusLogger in Sensor.loggers:
+            MessageBusLogger.bus.emit(Message(self.batch_message, {"sensors": [
+                {"state": value,
+                 "sensor_id": self.sensor_id(sensor),
+                 "device_name": _norm(sensor.device_name),
+                 "name": _norm(sensor.unique_id),
+                 "binary": isinstance(sensor, BooleanSensor),
+                 "attributes": sensor.attrs}
+                for sensor, value in changed]}))
+        return changed
+
+    def forget(self, sensor=None):
+        """ publish `sensor`, or every sensor, on the next tick regardless of its value """
+        with self._lock:
+            if sensor is None:
+                self._published.clear()
+            else:
+                self._published.pop(self.sensor_id(sensor), None)
@@ -0,0 +1,119 @@
+import os
+import time
+
+# https://www.kernel.org/doc/html/latest/power/powercap/powercap.html
+POWERCAP_ROOT = "/sys/class/powercap"
+
+
+class RAPLDomain:
+    """ one intel-rapl energy counter, keeps its file open for cheap re-reads """
+
+    def __init__(self, path, name, max_energy_range):
+        self.path = path
+        self.name = name
+        self.max_energy_range = max_energy_range  # µJ
+        self.fd = os.open(f"{path}/energy_uj", os.O_RDONLY)
+        self.energy = None  # last counter value, µJ
+        self.timestamp = None
+        self.power = 0  # W
+
+    @property
+    def is_package(self):
+        # intel-rapl:0 is a package, intel-rapl:0:0 one of its subzones
+        return os.path.basename(self.path).count(":") == 1
+
+    def read(self):
+        return int(os.pread(self.fd, 32, 0))
+
+    def sample(self, timestamp=None):
+        """ update and return watts since the previous sample, None on the first one """
+        t = time.monotonic() if timestamp is None else timestamp
+        e = self.read()
+        prev, prev_t = self.energy, self.timestamp
+        self.energy, self.timestamp = e, t
+        if prev is None or t <= prev_t:
+            return None
+        delta = e - prev
+        if delta < 0:  # counter wrapped around
+            delta += self.max_energy_range
+        self.power = delta / 1000000 / (t - prev_t)
+        return self.power
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+def find_rapl_domains(root=POWERCAP_ROOT):
+    """ readable intel-rapl zones under root
+
+    energy_uj is root only on most kernels since CVE-2020-8694,
+    unreadable zones are skipped
+    """
+    domains = []
+    if not os.path.isdir(root):
+        return domains
+    for zone in sorted(os.listdir(root)):
+        if not zone.startswith("intel-rapl:"):
+            continue
+        path = f"{root}/{zone}"
+        try:
+            with open(f"{path}/name") as f:
+                name = f.read().strip()
+            with open(f"{path}/max_energy_range_uj") as f:
+                max_range = int(f.read())
+            domain = RAPLDomain(path, name, max_range)
+            domain.read()
+        except (OSError, ValueError):
+            continue
+        domains.append(domain)
+
+    # subzones share names between packages (core, uncore, dram)
+    packages = {os.path.basename(d.path): d.name for d in domains if d.is_package}
+    for d in domains:
+        if not d.is_package:
+            parent = os.path.basename(d.path).rsplit(":", 1)[0]
+            d.name = f"{packages.get(parent, parent)}/{d.name}"
+    return domains
+
+
+class RAPLReader:
+    """ measured watts from RAPL energy counters, no sudo and no subprocess """
+
+    def __init__(self, root=POWERCAP_ROOT):
+        self.root = root
+        self.domains = find_rapl_domains(root)
+
+    @property
+    def available(self):
+        return bool(self.domains)
+
+    def sample(self):
+        """ watts per domain since the previous sample, empty on the first call """
+        t = time.monotonic()
+        readings = {}
+        for d in self.domains:
+            w = d.sample(t)
+            if w is not None:
+                readings[d.name] = w
+        return readings
+
+    def power(self):
+        """ total watts since the previous sample, None on the first call
+
+        psys covers the whole platform when present, otherwise sum the packages
+        """
+        readings = self.sample()
+        if not readings:
+            return None
+        if "psys" in readings:
+            return readings["psys"]
+        return sum(readings[d.name] for d in self.domains
+                   if d.is_package and d.name in readings)
+
+    def close(self):
+        for d in self.domains:
+            d.close()
+        self.domains = []
@@ -0,0 +1,169 @@
+import glob
+import json
+import os
+
+from powerguess.utils import DATA_DIR
+
+MODELS_DIR = DATA_DIR
+
+
+class CPUCounters:
+    """ cheap per-sample features from /proc/stat and cpufreq, read through reused handles """
+
+    def __init__(self, cpufreq_glob="/sys/devices/system/cpu/cpu[0-9]*/cpufreq"):
+        self._stat = os.open("/proc/stat", os.O_RDONLY)
+        self._prev = None
+        self._freqs = []
+        for d in sorted(glob.glob(cpufreq_glob)):
+            try:
+                with open(f"{d}/cpuinfo_max_freq") as f:
+                    fmax = int(f.read())
+                self._freqs.append((os.open(f"{d}/scaling_cur_freq", os.O_RDONLY), fmax))
+            except (OSError, ValueError):
+                continue
+        self.n_cpus = len(self._read_stat())
+
+    def _read_stat(self):
+        # [(busy, total)] jiffies per core
+        data = os.pread(self._stat, 65536, 0).decode("utf-8")
+        cores = []
+        for l in data.split("\n"):
+            if not l.startswith("cpu") or l.startswith("cpu "):
+                continue
+            v = [int(x) for x in l.split()[1:]]
+            idle = v[3] + (v[4] if len(v) > 4 else 0)  # idle + iowait
+            total = sum(v[:8])
+            cores.append((total - idle, total))
+        return cores
+
+    def utilisation(self):
+        """ per-core busy fraction since the previous call """
+        cores = self._read_stat()
+        prev, self._prev = self._prev, cores
+        if prev is None or len(prev) != len(cores):
+            return [0.0] * len(cores)
+        return [(b - pb) / (t - pt) if t > pt else 0.0
+                for (b, t), (pb, pt) in zip(cores, prev)]
+
+    def frequency(self):
+        """ mean current/max frequency ratio, 1 if cpufreq is not available """
+        if not self._freqs:
+            return 1.0
+        return sum(int(os.pread(fd, 32, 0)) / fmax for fd, fmax in self._freqs) / len(self._freqs)
+
+    def features(self):
+        """ [1, core utilisation sorted busiest first..., freq ratio, mean utilisation * freq ratio]
+
+        sorting makes the model independent of which core the scheduler picked
+        """
+        util = sorted(self.utilisation(), reverse=True)
+        freq = self.frequency()
+        return [1.0] + util + [freq, freq * sum(util) / max(len(util), 1)]
+
+
+class OnlinePowerModel:
+    """ recursive least squares fit of watts from CPUCounters features
+
+    every update costs O(features²), `forgetting` < 1 lets the model follow
+    slow drifts, state is persisted as json so a model learned on a metered
+    device can be copied to an identical one without a meter
+    """
+
+    def __init__(self, n_features, forgetting=0.999, delta=1000.0, path=None, save_every=60):
+        self.n_features = n_features
+        self.forgetting = forgetting
+        self.path = path
+        self.save_every = save_every
+        self.weights = [0.0] * n_features
+        self.P = [[delta if r == c else 0.0 for c in range(n_features)]
+                  for r in range(n_features)]
+        self.samples = 0
+        self.error = 0.0  # running mean absolute error, W
+
+    @property
+    def trained(self):
+        return self.samples >= 2 * self.n_features
+
+    def predict(self, x):
+        return sum(w * f for w, f in zip(self.weights, x))
+
+    def update(self, x, y):
+        """ add one (features, measured watts) sample """
+        n = self.n_features
+        P = self.P
+        Px = [sum(P[r][c] * x[c] for c in range(n)) for r in range(n)]
+        denom = self.forgetting + sum(x[r] * Px[r] for r in range(n))
+        k = [v / denom for v in Px]
+        err = y - self.predict(x)
+        self.weights = [w + kv * err for w, kv in zip(self.weights, k)]
+        # P = (P - k (Px)^T) / lambda, P stays symmetric
+        lam = self.forgetting
+        self.P = [[(P[r][c] - k[r] * Px[c]) / lam for c in range(n)] for r in range(n)]
+        self.samples += 1
+        self.error += (abs(err) - self.error) / min(self.samples, 100)
+        if self.path and self.samples % self.save_every == 0:
+            self.save()
+        return err
+
+    def save(self, path=None):
+        path = path or self.path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"weights": self.weights, "P": self.P, "samples": self.samples,
+                       "forgetting": self.forgetting, "error": self.error}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path, save_every=60):
+        with open(path) as f:
+            data = json.load(f)
+        model = cls(len(data["weights"]), data.get("forgetting", 0.999),
+                    path=path, save_every=save_every)
+        model.weights = data["weights"]
+        model.P = data["P"]
+        model.samples = data.get("samples", 0)
+        model.error = data.get("error", 0.0)
+        return model
+
+
+class LearnedEstimator:
+    """ CPUCounters + OnlinePowerModel, learns from measured watts and predicts without them """
+
+    def __init__(self, path=None):
+        self.counters = CPUCounters()
+        n = len(self.counters.features())
+        self.model = None
+        if path and os.path.isfile(path):
+            try:
+                model = OnlinePowerModel.load(path)
+                if model.n_features == n:
+                    self.model = model
+                else:
+                    print(f"ignoring {path}, it was learned on a device with a different cpu count")
+            except Exception as e:
+                print(f"failed to load {path}: {e}")
+        self.model = self.model or OnlinePowerModel(n, path=path)
+        self._features = None
+
+    @property
+    def trained(self):
+        return self.model.trained
+
+    def sample(self):
+        """ read the counters for this tick, learn() and estimate() reuse them """
+        self._features = self.counters.features()
+        return self._features
+
+    def learn(self, watts):
+        if self._features is None:
+            self.sample()
+        return self.model.update(self._features, watts)
+
+    def estimate(self):
+        if self._features is None:
+            self.sample()
+        return max(self.model.predict(self._features), 0.0)
+
+    def save(self):
+        if self.model.path:
+            self.model.save()
@@ -0,0 +1,106 @@
+""" battery time to empty / time to full from a decayed rate model
+
+the charge and discharge rates are exponentially weighted over `tau` seconds,
+a short current spike barely moves them, every update and query is O(1) and
+the whole state is a dozen floats
+"""
+import math
+import threading
+import time
+
+from powerguess.utils import get_battery
+
+
+class BatteryRuntimePredictor:
+    """ stable time to empty and time to full with confidence bounds
+
+    register callback() on a PowerStatMonitor or call update() directly
+    """
+    __slots__ = ("tau", "z", "t", "energy", "energy_full", "status",
+                 "discharge", "discharge_var", "discharge_w2",
+                 "charge", "charge_var", "charge_w2")
+
+    def __init__(self, tau=600, z=1.96):
+        self.tau = tau  # s, time constant of the rate averages
+        self.z = z  # bounds are mean rate ± z standard errors, 1.96 ~ 95 %
+        self.t = None
+        self.energy = 0.0  # Wh stored
+        self.energy_full = 0.0
+        self.status = ""
+        # W, exponentially weighted mean and variance, sum of squared weights
+        self.discharge = self.discharge_var = self.discharge_w2 = 0.0
+        self.charge = self.charge_var = self.charge_w2 = 0.0
+
+    def update(self, rate, energy, energy_full, status, timestamp=None):
+        """ rate: W leaving the battery while discharging or entering it while charging
+        energy, energy_full: Wh """
+        t = time.monotonic() if timestamp is None else timestamp
+        dt = t - self.t if self.t is not None else self.tau
+        self.t = t
+        self.energy, self.energy_full, self.status = energy, energy_full, status
+        if rate <= 0 or dt <= 0:
+            return
+        # a long gap (eg. a whole charge cycle) never wipes more than 1 - 1/e of the history
+        a = 1 - math.exp(-min(dt, self.tau) / self.tau)
+        if status == "Discharging":
+            self.discharge, self.discharge_var, self.discharge_w2 = \
+                self._blend(self.discharge, self.discharge_var, self.discharge_w2, rate, a)
+        elif status == "Charging":
+            self.charge, self.charge_var, self.charge_w2 = \
+                self._blend(self.charge, self.charge_var, self.charge_w2, rate, a)
+
+    @staticmethod
+    def _blend(mean, var, w2, x, a):
+        if not w2:  # first sample
+            return x, 0.0, 1.0
+        diff = x - mean
+        incr = a * diff
+        return mean + incr, (1 - a) * (var + diff * incr), (1 - a) ** 2 * w2 + a ** 2
+
+    def _hours(self, energy, mean, var, w2):
+        if mean <= 0:
+            return None  # no rate measured yet
+        se = math.sqrt(var * w2)
+        high_rate = mean + self.z * se
+        low_rate = mean - self.z * se
+        return (energy / mean,
+                energy / high_rate,
+                energy / low_rate if low_rate > 0 else math.inf)
+
+    def time_to_empty(self):
+        """ (hours, lower, upper) while discharging, None otherwise or when the
+        stored energy or the discharge rate is unknown """
+        if self.status != "Discharging" or self.energy <= 0:
+            return None  # energy_now 0 is a battery without energy readings, not an empty one
+        return self._hours(self.energy, self.discharge, self.discharge_var, self.discharge_w2)
+
+    def time_to_full(self):
+        """ (hours, lower, upper) while charging, None otherwise or when the
+        capacity or the charge rate is unknown """
+        if self.status != "Charging" or self.energy_full <= 0:
+            return None
+        return self._hours(max(self.energy_full - self.energy, 0.0),
+                           self.charge, self.charge_var, self.charge_w2)
+
+    def callback(self, reading, model=None):
+        bat = get_battery()
+        if not bat:
+            return
+        p, v, i = reading
+        rate = bat["power"]
+        if not rate and bat["status"] == "Discharging":
+            rate = p  # no power_now / current_now, the device draw is the battery output
+        self.update(rate, bat["energy"], bat["energy_full"], bat["status"])
+
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+def get_runtime_predictor():
+    """ shared BatteryRuntimePredictor, fed by the PHAL device monitor """
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            _predictor = BatteryRuntimePredictor()
+        return _predictor
@@ -0,0 +1,104 @@
+""" adaptive sampling, measure often while the device is busy and rarely while it idles
+
+cheap signals (cpu counters, battery status) are polled every `poll_interval`,
+the expensive measurement runs on its own interval that doubles while nothing
+changes and drops back to `min_interval` as soon as a cheap signal or the
+measured power moves past its threshold
+
+    p = PowerStatMonitor(scheduler=AdaptiveScheduler(min_interval=0.5, max_interval=60))
+"""
+import time
+
+from powerguess.metrics import metrics
+from powerguess.regression import CPUCounters
+from powerguess.utils import get_battery
+
+
+class CheapSignals:
+    """ mean cpu utilisation and battery status, a pread and a cached sysfs scan """
+
+    def __init__(self, counters=None):
+        self.counters = counters or CPUCounters()
+
+    def sample(self):
+        util = self.counters.utilisation()
+        bat = get_battery()
+        return sum(util) / len(util) if util else 0.0, bat["status"] if bat else None
+
+
+class AdaptiveScheduler:
+    """ decides how long a monitor waits before its next measurement
+
+    budget is the fraction of one core the monitor may spend sampling, cheap
+    polls and measurements together, intervals are stretched to stay under it
+    """
+
+    def __init__(self, min_interval=1, max_interval=60, poll_interval=1, backoff=2,
+                 cpu_threshold=0.15, power_threshold=0.2, budget=0.01, signals=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.cpu_threshold = cpu_threshold  # absolute change in mean utilisation, 0-1
+        self.power_threshold = power_threshold  # relative change in measured watts
+        self.budget = budget
+        self.signals = signals or CheapSignals()
+        self.interval = min_interval
+        self.measure_cost = 0.0  # s, moving average per measurement
+        self.poll_cost = 0.0  # s, moving average per cheap poll
+        self._cpu, self._status = self.signals.sample()
+        self._level = self._cpu  # smoothed cpu, single short polls are jiffy noise
+        self._power = None
+
+    @staticmethod
+    def _average(avg, value):
+        return value if not avg else avg + (value - avg) / 8
+
+    @property
+    def effective_poll_interval(self):
+        # cheap polls get at most half of the budget
+        return max(self.poll_interval, self.poll_cost / (self.budget / 2))
+
+    @property
+    def effective_interval(self):
+        """ current measurement interval, never below what the budget allows """
+        spare = self.budget - self.poll_cost / self.effective_poll_interval
+        floor = self.measure_cost / spare if spare > 0 else self.max_interval
+        return min(max(self.interval, floor), max(self.max_interval, floor))
+
+    def changed(self):
+        """ poll the cheap signals, True if they moved since the last measurement """
+        start = time.perf_counter()
+        cpu, status = self.signals.sample()
+        self.poll_cost = self._average(self.poll_cost, time.perf_counter() - start)
+        self._level += (cpu - self._level) / 2
+        return abs(self._level - self._cpu) > self.cpu_threshold or status != self._status
+
+    def measured(self, cost, power=None):
+        """ record one measurement that took `cost` seconds and pick the next interval """
+        self.measure_cost = self._average(self.measure_cost, cost)
+        if power and self._power and abs(power - self._power) > self.power_threshold * self._power:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        if power:
+            self._power = power
+        cpu, self._status = self.signals.sample()
+        self._level += (cpu - self._level) / 2
+        self._cpu = self._level
+
+    def wait(self, stop_event):
+        """ block until the next measurement is due, True if a change cut the wait short """
+        deadline = time.monotonic() + self.effective_interval
+        while not stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics.inc("scheduler_wakeups", labels={"reason": "interval"})
+                return False
+            if stop_event.wait(min(self.effective_poll_interval, remaining)):
+                break
+            if self.changed():
+                self.interval = self.min_interval
+                metrics.inc("scheduler_wakeups", labels={"reason": "change"})
+                return True
+        return False
@@ -2,19 +2,28 @@ import dataclasses
 
 from ovos_PHAL_sensors.sensors.base import PercentageSensor, NumericSensor, Sensor, BooleanSensor
 
-from powerguess.guess import PowerStatMonitor
-from powerguess.utils import get_battery_info, get_energy_delta_per_second
+from powerguess.delta import get_delta_monitor
+from powerguess.monitor import get_monitor
+from powerguess.runtime import get_runtime_predictor
+from powerguess.utils import get_battery
+
+
+def _current_value(monitor):
+    m = get_monitor(monitor)
+    return m.current_value if m else (0, 0, 0)
 
 
 @dataclasses.dataclass
 class PowerGuessPowerSensor(NumericSensor):
     unique_id: str = "power"
     device_name: str = "powerguess"
+    monitor = "default"  # registered monitor to read, not a dataclass field
     unit: str = "W"
+    deadband = 0.1  # W
 
     @property
     def value(self):
-        p, v, i = PowerStatMonitor.current_value
+        p, v, i = _current_value(self.monitor)
         return p
 
     @property
@@ -28,11 +37,13 @@ class PowerGuessPowerSensor(NumericSensor):
 class PowerGuessCurrentSensor(NumericSensor):
     unique_id: str = "current"
     device_name: str = "powerguess"
+    monitor = "default"  # registered monitor to read, not a dataclass field
     unit: str = "A"
+    deadband = 0.01  # A
 
     @property
     def value(self):
-        p, v, i = PowerStatMonitor.current_value
+        p, v, i = _current_value(self.monitor)
         return i
 
     @property
@@ -46,11 +57,13 @@ class PowerGuessCurrentSensor(NumericSensor):
 class PowerGuessVoltageSensor(NumericSensor):
     unique_id: str = "voltage"
     device_name: str = "powerguess"
+    monitor = "default"  # registered monitor to read, not a dataclass field
     unit: str = "V"
+    deadband = 0.05  # V
 
     @property
     def value(self):
-        p, v, i = PowerStatMonitor.current_value
+        p, v, i = _current_value(self.monitor)
         return v
 
     @property
@@ -60,14 +73,38 @@ class PowerGuessVoltageSensor(NumericSensor):
                 "unit_of_measurement": self.unit}
 
 
+@dataclasses.dataclass
+class PowerGuessEnergySensor(NumericSensor):
+    unique_id: str = "energy"
+    device_name: str = "powerguess"
+    unit: str = "kWh"
+    monitor = "default"  # registered monitor to read, not a dataclass field
+    deadband = 0.001  # kWh
+
+    @property
+    def value(self):
+        m = get_monitor(self.monitor)
+        if m is None or m.energy_meter is None:
+            return 0
+        return round(m.energy_meter.kwh, 5)
+
+    @property
+    def attrs(self):
+        return {"friendly_name": self.__class__.__name__,
+                "device_class": "energy",
+                "state_class": "total_increasing",
+                "unit_of_measurement": self.unit}
+
+
 @dataclasses.dataclass
 class BatterySensor(PercentageSensor):
     unique_id: str = "percent"
     device_name: str = "battery"
+    deadband = 1  # %
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return 0
         return round(battery["capacity"], 3)
@@ -84,10 +121,11 @@ class BatteryPowerConsumptionSensor(NumericSensor):
     unique_id: str = "power_consumption"
     device_name: str = "battery"
     unit: str = "W"
+    deadband = 0.1  # W
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return 0
         if battery["status"] == "Charging":
@@ -106,10 +144,11 @@ class BatteryPowerProductionSensor(NumericSensor):
     unique_id: str = "power_production"
     device_name: str = "battery"
     unit: str = "W"
+    deadband = 0.1  # W
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return 0
         if battery["status"] == "Discharging":
@@ -129,10 +168,11 @@ class BatteryCurrentSensor(NumericSensor):
     unique_id: str = "current"
     device_name: str = "battery"
     unit: str = "A"
+    deadband = 0.01  # A
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return 0
         c = round(battery["current"], 3)
@@ -152,10 +192,11 @@ class BatteryVoltageSensor(NumericSensor):
     unique_id: str = "voltage"
     device_name: str = "battery"
     unit: str = "V"
+    deadband = 0.05  # V
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return 0
         return round(battery["voltage"], 3)
@@ -172,10 +213,11 @@ class BatteryChargeSensor(NumericSensor):
     unique_id: str = "charge"
     device_name: str = "battery"
     unit: str = "Ah"
+    deadband = 0.01  # Ah
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return 0
         return round(battery["charge"], 3)
@@ -191,13 +233,14 @@ class BatteryEnergyDeltaSensor(NumericSensor):
     unique_id: str = "energy_delta"
     device_name: str = "battery"
     unit: str = "mWh/s"
+    deadband = 0.01  # mWh/s
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return 0
-        return get_energy_delta_per_second(self.unit.replace("/s", ""))[0]
+        return get_delta_monitor().energy_rate(self.unit.replace("/s", ""))[0]
 
     @property
     def attrs(self):
@@ -213,7 +256,7 @@ class BatteryStatusSensor(Sensor):
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return "unknown"
         return battery["status"]
@@ -229,10 +272,11 @@ class BatteryStoredEnergySensor(NumericSensor):
     unique_id: str = "stored_energy"
     device_name: str = "battery"
     unit: str = "kWh"
+    deadband = 0.001  # kWh
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return 0
         return round(battery["charge"] * battery["voltage"], 5)
@@ -244,6 +288,62 @@ class BatteryStoredEnergySensor(NumericSensor):
                 "unit_of_measurement": self.unit}
 
 
+@dataclasses.dataclass
+class BatteryTimeToEmptySensor(NumericSensor):
+    unique_id: str = "time_to_empty"
+    device_name: str = "battery"
+    unit: str = "min"
+    deadband = 1  # min
+
+    @property
+    def value(self):
+        prediction = get_runtime_predictor().time_to_empty()
+        if prediction is None:
+            return None  # unknown, still warming up or not discharging
+        return round(prediction[0] * 60)
+
+    @property
+    def attrs(self):
+        prediction = get_runtime_predictor().time_to_empty()
+        lower = upper = None
+        if prediction is not None:
+            lower = round(prediction[1] * 60)
+            upper = round(prediction[2] * 60) if prediction[2] != float("inf") else None
+        return {"friendly_name": self.__class__.__name__,
+                "device_class": "duration",
+                "unit_of_measurement": self.unit,
+                "lower": lower,
+                "upper": upper}
+
+
+@dataclasses.dataclass
+class BatteryTimeToFullSensor(NumericSensor):
+    unique_id: str = "time_to_full"
+    device_name: str = "battery"
+    unit: str = "min"
+    deadband = 1  # min
+
+    @property
+    def value(self):
+        prediction = get_runtime_predictor().time_to_full()
+        if prediction is None:
+            return None  # unknown, still warming up or not charging
+        return round(prediction[0] * 60)
+
+    @property
+    def attrs(self):
+        prediction = get_runtime_predictor().time_to_full()
+        lower = upper = None
+        if prediction is not None:
+            lower = round(prediction[1] * 60)
+            upper = round(prediction[2] * 60) if prediction[2] != float("inf") else None
+        return {"friendly_name": self.__class__.__name__,
+                "device_class": "duration",
+                "unit_of_measurement": self.unit,
+                "lower": lower,
+                "upper": upper}
+
+
 @dataclasses.dataclass
 class BatteryChargingSensor(BooleanSensor):
     unique_id: str = "charging"
@@ -251,7 +351,7 @@ class BatteryChargingSensor(BooleanSensor):
 
     @property
     def value(self):
-        battery = list(get_battery_info())[0]
+        battery = get_battery()
         if battery is None:
             return False
         return battery["status"] == "Charging"
@@ -0,0 +1,289 @@
+""" one sampler, any number of local readers over shared memory
+
+    python -m powerguess.shm            # run the daemon, once per device
+
+    from powerguess.shm import ReadingBusClient
+    bus = ReadingBusClient()
+    p, v, i = bus.current()
+
+the daemon runs the only PowerStatMonitor and writes every reading, plus a
+ring of recent history, into a memory mapped file under /dev/shm, writes are
+wrapped in a sequence counter (a seqlock), readers retry the rare read that
+overlapped a write, so a read never tears and, unless it keeps colliding with
+the writer, never makes a syscall
+
+python and mmap give no store ordering guarantee, on weakly ordered cpus like
+arm a reader can see the new sequence number before the whole payload, so the
+latest reading and every history record also carry a crc32 that the reader
+checks before accepting a snapshot
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from powerguess.sources import PowerSource
+
+MAGIC = b"PGSHM002"
+# magic, capacity, record size, seq, count, model, crc32 of count, model and current
+_HEADER = struct.Struct("<8sIIQQ64sI4x")
+_META = struct.Struct("<Q64s")  # count, model
+# t (unix), p, v, i, kWh
+_CURRENT = struct.Struct("<ddddd")
+# t (unix), p, v, i, crc32 of the 4 doubles
+_RECORD = struct.Struct("<ddddI4x")
+_RECORD_DATA = 32
+_SEQ = struct.Struct("<Q")
+_CRC = struct.Struct("<I")
+_SEQ_OFFSET = 16
+_COUNT_OFFSET = 24
+_CRC_OFFSET = _COUNT_OFFSET + _META.size
+_CURRENT_OFFSET = _HEADER.size
+_RING_OFFSET = _CURRENT_OFFSET + _CURRENT.size
+
+
+def default_path():
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/powerguess"
+    return f"{os.environ.get('XDG_RUNTIME_DIR', '/tmp')}/powerguess.shm"
+
+
+def segment_size(capacity):
+    return _RING_OFFSET + capacity * _RECORD.size
+
+
+class ReadingBusPublisher:
+    """ writer side, register callback() on the one monitor of this device
+
+    p = PowerStatMonitor()
+    p.add_callback(ReadingBusPublisher().callback)
+    """
+
+    def __init__(self, path=None, capacity=3600, monitor=None):
+        self.path = path or default_path()
+        self.capacity = capacity  # readings kept for history()
+        self.monitor = monitor  # energy total is read from its energy meter
+        self.seq = 0
+        self.count = 0
+        self._lock = threading.Lock()
+        # never open the predictable path itself, /dev/shm is world writable and a
+        # planted file or symlink would be written through, a fresh file (mkstemp
+        # uses O_EXCL | O_NOFOLLOW) is swapped in instead, readers still mapping
+        # the segment of a previous daemon keep it intact and reattach
+        directory, name = os.path.split(self.path)
+        fd, tmp = tempfile.mkstemp(prefix=f".{name}.", dir=directory or ".")
+        try:
+            os.fchmod(fd, 0o644)  # world readable even when the daemon runs as root
+            os.ftruncate(fd, segment_size(capacity))
+            self.mm = mmap.mmap(fd, segment_size(capacity))
+            _HEADER.pack_into(self.mm, 0, MAGIC, capacity, _RECORD.size, 0, 0, b"",
+                              zlib.crc32(bytes(_META.size + _CURRENT.size)))
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        finally:
+            os.close(fd)
+
+    def publish(self, reading, model="", energy=0.0, timestamp=None):
+        t = time.time() if timestamp is None else timestamp
+        p, v, i = reading
+        with self._lock:
+            data = _RECORD.pack(t, p, v, i, 0)[:_RECORD_DATA]
+            meta = _META.pack(self.count + 1, model.encode("utf-8")[:64])
+            current = _CURRENT.pack(t, p, v, i, energy)
+            self.seq += 1  # odd, write in progress
+            _SEQ.pack_into(self.mm, _SEQ_OFFSET, self.seq)
+            _CURRENT.pack_into(self.mm, _CURRENT_OFFSET, t, p, v, i, energy)
+            _RECORD.pack_into(self.mm, _RING_OFFSET + (self.count % self.capacity) * _RECORD.size,
+                              t, p, v, i, zlib.crc32(data))
+            self.count += 1
+            self.mm[_COUNT_OFFSET:_CRC_OFFSET] = meta
+            _CRC.pack_into(self.mm, _CRC_OFFSET, zlib.crc32(meta + current))
+            self.seq += 1  # even, consistent again
+            _SEQ.pack_into(self.mm, _SEQ_OFFSET, self.seq)
+
+    def callback(self, reading, model=None):
+        meter = getattr(self.monitor, "energy_meter", None)
+        self.publish(reading, model or "", meter.kwh if meter else 0.0)
+
+    def close(self):
+        self.mm.close()
+
+
+class ReadingBusClient:
+    """ reader side, attaches to the daemon segment, every read is a memory copy
+
+    a restarted daemon swaps in a new segment, the client checks for that at
+    most every `check_interval` seconds and reattaches
+    """
+
+    def __init__(self, path=None, timeout=1.0, check_interval=1.0):
+        self.path = path or default_path()
+        self.timeout = timeout  # s, give up on a writer that died mid write
+        self.check_interval = check_interval
+        self.mm = None
+        self._attach()
+
+    def _attach(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            st = os.fstat(fd)
+            mm = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        magic, capacity, record_size = _HEADER.unpack_from(mm)[:3]
+        if magic != MAGIC or record_size != _RECORD.size or len(mm) < segment_size(capacity):
+            mm.close()
+            raise ValueError(f"{self.path} is not a powerguess reading bus")
+        if self.mm is not None:
+            self.mm.close()
+        self.mm, self.capacity = mm, capacity
+        self._inode = st.st_dev, st.st_ino
+        self._checked = time.monotonic()
+
+    def _check(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return  # daemon stopped, keep serving its last readings
+        if (st.st_dev, st.st_ino) != self._inode:
+            try:
+                self._attach()
+            except (OSError, ValueError) as e:
+                print(f"could not reattach to {self.path}: {e}")
+
+    def _consistent(self, read):
+        self._check()
+        mm = self.mm
+        deadline = None
+        spins = 0
+        while True:
+            s1 = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if not s1 & 1:  # even, no write in progress
+                value = read()  # None when a checksum did not match
+                if value is not None and _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] == s1:
+                    return value
+            # overlapped a write, spin a little then let the writer run
+            spins += 1
+            if spins > 100:
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                elif time.monotonic() > deadline:
+                    raise TimeoutError("reading bus writer did not finish in time")
+                time.sleep(0.0001)
+
+    def _latest(self):
+        # count, model, crc and current in one copy, None unless the crc matches
+        raw = self.mm[_COUNT_OFFSET:_RING_OFFSET]
+        meta, current = raw[:_META.size], raw[_CURRENT_OFFSET - _COUNT_OFFSET:]
+        if zlib.crc32(meta + current) != _CRC.unpack_from(raw, _META.size)[0]:
+            return None
+        return _CURRENT.unpack(current), _META.unpack(meta)
+
+    def reading(self):
+        """ {"t", "p", "v", "i", "energy", "count", "model"} of the latest reading """
+        (t, p, v, i, energy), (count, model) = self._consistent(self._latest)
+        return {"t": t, "p": p, "v": v, "i": i, "energy": energy, "count": count,
+                "model": model.rstrip(b"\x00").decode("utf-8", "replace")}
+
+    def current(self):
+        """ (p, v, i) of the latest reading """
+        t, p, v, i, _ = self._consistent(self._latest)[0]
+        return p, v, i
+
+    @property
+    def count(self):
+        """ readings published since the daemon started """
+        self._check()
+        return _SEQ.unpack_from(self.mm, _COUNT_OFFSET)[0]
+
+    @property
+    def age(self):
+        """ seconds since the latest reading """
+        t = self._consistent(self._latest)[0][0]
+        return time.time() - t if t else float("inf")
+
+    def history(self, n=None):
+        """ [(t, p, v, i)] up to the last `n` readings, oldest first """
+        def read():
+            count = _SEQ.unpack_from(self.mm, _COUNT_OFFSET)[0]
+            k = min(count, self.capacity if n is None else min(n, self.capacity))
+            first = (count - k) % self.capacity
+            records = []
+            for start, length in ((first, min(k, self.capacity - first)),
+                                  (0, k - min(k, self.capacity - first))):
+                if length:
+                    off = _RING_OFFSET + start * _RECORD.size
+                    raw = self.mm[off:off + length * _RECORD.size]
+                    for n_off in range(0, len(raw), _RECORD.size):
+                        t, p, v, i, crc = _RECORD.unpack_from(raw, n_off)
+                        if zlib.crc32(raw[n_off:n_off + _RECORD_DATA]) != crc:
+                            return None
+                        records.append((t, p, v, i))
+            return records
+        return self._consistent(read)
+
+    def close(self):
+        self.mm.close()
+
+
+class SharedMemorySource(PowerSource):
+    """ readings of the daemon as a source, for a PowerMonitor or sensors in another process """
+    name = "shm"
+    interval = 1
+
+    def __init__(self, path=None):
+        self.client = ReadingBusClient(path)
+        self._seen = 0
+
+    @property
+    def model(self):
+        return self.client.reading()["model"]
+
+    def read(self, timeout=None):
+        r = self.client.reading()
+        if r["count"] < self._seen:  # daemon restarted, its count starts over
+            self._seen = 0
+        if r["count"] == self._seen:
+            return None  # nothing new since the previous read
+        self._seen = r["count"]
+        return r["p"], r["v"], r["i"]
+
+    def close(self):
+        self.client.close()
+
+
+def main():
+    import argparse
+    from powerguess.guess import PowerStatMonitor
+
+    parser = argparse.ArgumentParser(description="measure once, share readings with every local process")
+    parser.add_argument("--path", default=None, help=f"shared memory file, default {default_path()}")
+    parser.add_argument("--capacity", type=int, default=3600, help="readings kept for history")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between measurements")
+    args = parser.parse_args()
+
+    monitor = PowerStatMonitor(time_between_measures=args.interval)
+    publisher = ReadingBusPublisher(args.path, args.capacity, monitor)
+    monitor.add_callback(publisher.callback)
+    monitor.start()
+    print(f"publishing readings to {publisher.path}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+        publisher.close()
+
+
+if __name__ == "__main__":
+    main()
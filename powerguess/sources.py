@@ -0,0 +1,266 @@
+""" power sources, each owns its own state and knows the rate it can be sampled at
+
+read() returns a (p, v, i) reading or None when nothing new is available,
+streaming sources block in read() until their next sample arrives
+"""
+import json
+import os
+import platform
+import queue
+
+import psutil
+
+from powerguess.components import ComponentEstimator
+from powerguess.curve import LoadCurve
+from powerguess.metrics import metrics
+from powerguess.monitor import Sample
+from powerguess.powerstat import PowerStatReader, POWERSTAT_COMMAND
+from powerguess.rapl import RAPLReader, POWERCAP_ROOT
+from powerguess.regression import CPUCounters, LearnedEstimator, MODELS_DIR
+from powerguess.utils import get_batteries, get_battery, detect_model, \
+    load_hardware_cache, save_hardware_cache
+
+
+class PowerSource:
+    name = "base"
+    interval = 5  # default seconds between samples
+    streaming = False  # read() paces itself
+
+    @property
+    def available(self):
+        return True
+
+    @property
+    def model(self):
+        return detect_model()
+
+    def read(self, timeout=None):
+        return None
+
+    def close(self):
+        pass
+
+
+class GuessSource(PowerSource):
+    """ estimate from cpu usage and a reference model json in powerguess/models """
+    name = "guess"
+
+    def __init__(self, model=None, cpu_source=None):
+        self._model = model
+        self.benchmarks = {}
+        self.curve = None  # LoadCurve compiled from benchmarks
+        self.cpu_source = cpu_source or psutil.cpu_percent  # system cpu %
+        self.counters = None  # CPUCounters, only for curves measured at several frequencies
+        self.components = None  # ComponentEstimator, for models with a "components" section
+        self.learned = None  # LearnedEstimator, fitted online from measured readings
+        self.last_error = 0.0  # W, error bound of the last estimate
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = detect_model()
+        return self._model
+
+    @staticmethod
+    def select_benchmark(model):
+        """ model json file name for a detected model string """
+        if "Raspberry Pi 4" in model:
+            m = "pi4.json"
+        elif "Raspberry Pi 3 Model B Plus" in model:
+            m = "pi3bplus.json"
+        elif "Raspberry Pi 3" in model:
+            m = "pi3b.json"
+        elif "Raspberry Pi 2" in model:
+            m = "pi2b.json"
+        elif "Raspberry Pi Zero 2" in model:
+            m = "pi02.json"
+        elif "Raspberry Pi Zero" in model:
+            m = "pi0.json"
+        elif "U500-H" in model:
+            m = "minipc_generic.json"
+        # catch all - generic laptop
+        elif platform.machine() == "x86_64" and get_batteries():
+            m = "laptop_generic.json"
+        # catch all - sbc
+        elif platform.machine() == "aarch64" or "Raspberry Pi" in model:
+            m = "sbc_generic.json"
+        # catch all - PC
+        else:
+            m = "pc_generic.json"
+        return m
+
+    def set_model(self, model):
+        self._model = model
+        cache = load_hardware_cache()
+        if cache.get("model") == model and cache.get("benchmark"):
+            m = cache["benchmark"]
+        else:
+            m = self.select_benchmark(model)
+            if cache.get("model") == model:
+                save_hardware_cache(benchmark=m)
+
+        with open(f"{os.path.dirname(__file__)}/models/{m}") as f:
+            self.load_benchmarks(json.load(f))
+
+    def load_benchmarks(self, benchmarks):
+        """ use a model json dict, see powerguess.curve for the schema """
+        self.benchmarks = benchmarks
+        self.curve = LoadCurve.from_model(benchmarks)
+        if self.curve.rows > 1 and self.counters is None:
+            self.counters = CPUCounters()
+        if self.components:
+            self.components.close()
+            self.components = None
+        if benchmarks.get("components"):
+            self.components = ComponentEstimator(benchmarks["components"])
+
+    def enable_learning(self, path=None):
+        """ fit a per-device model from measured readings and use it for estimates
+
+        path defaults to one file per detected model, copy it to an identical
+        device without a meter to reuse what was learned here
+        """
+        if path is None:
+            name = "".join(c if c.isalnum() else "_" for c in self.model.strip("\x00")) or "default"
+            path = f"{MODELS_DIR}/{name}.json"
+        self.learned = LearnedEstimator(path)
+        return self.learned
+
+    def voltage(self):
+        """ supply voltage from the model json """
+        if not self.curve:
+            self.set_model(self.model)
+        return self.curve.lookup(50)[1]
+
+    def estimate(self):
+        p, v, i, err = self.estimate_with_error()
+        return p, v, i
+
+    def estimate_with_error(self):
+        """ (p, v, i, error), the true power is expected within p ± error """
+        if not self.curve:
+            self.set_model(self.model)
+
+        if self.learned:
+            # features of this tick, a measured reading learned later in the tick reuses them
+            self.learned.sample()
+
+        # estimate from the model learned on measured readings
+        if self.learned and self.learned.trained:
+            p = self.learned.estimate()
+            v = self.voltage()
+            i = p / v if v else 0
+            err = self.learned.model.error
+        else:
+            # estimate consumption based on cpu usage
+            cpu = self.cpu_source()
+            freq = None
+            if self.components:
+                # disk, network and memory activity, frequency residency when available
+                freq = self.components.sample()["freq"]
+            if freq is None:
+                freq = self.counters.frequency() if self.counters else 1.0
+            p, v, i, err = self.curve.lookup(cpu, freq)
+            if self.components:
+                p += self.components.power()
+                i = p / v if v else i
+        self.last_error = err
+        return p, v, i, err
+
+    def read(self, timeout=None):
+        with metrics.timed("guesstimate"):
+            return self.estimate()
+
+    def close(self):
+        if self.learned:
+            self.learned.save()
+        if self.components:
+            self.components.close()
+
+
+class BatterySource(PowerSource):
+    """ battery output while discharging, assumed to be the whole device input """
+    name = "battery"
+    interval = 10
+
+    @property
+    def available(self):
+        return bool(get_battery())
+
+    @property
+    def battery(self):
+        return get_battery()
+
+    def consumption(self):
+        # energy being consumed in addition to energy from laptop
+        bat = get_battery()
+        if bat and bat["status"] == "Charging":
+            return bat["power"], bat["voltage"], bat["current"]
+        return 0, 0, 0
+
+    def output(self):
+        # energy being provided to laptop
+        bat = get_battery()
+        if bat and bat["status"] == "Discharging":
+            return bat["power"], bat["voltage"], bat["current"]
+        return 0, 0, 0
+
+    def read(self, timeout=None):
+        p, v, i = self.output()
+        return (p, v, i) if p else None
+
+
+class RAPLSource(PowerSource):
+    """ measured package watts from RAPL counters, fine for sub-second rates
+
+    RAPL has no voltage, it is taken from `guess` when given
+    """
+    name = "rapl"
+    interval = 1
+
+    def __init__(self, root=POWERCAP_ROOT, guess=None):
+        self.reader = RAPLReader(root)
+        self.guess = guess
+        self.reader.power()  # first sample only primes the counters
+
+    @property
+    def available(self):
+        return self.reader.available
+
+    def read(self, timeout=None):
+        with metrics.timed("rapl_read"):
+            p = self.reader.power()
+        if p is None:
+            return None
+        v = self.guess.voltage() if self.guess else 0
+        return p, v, p / v if v else 0
+
+    def close(self):
+        self.reader.close()
+
+
+class PowerStatSource(PowerSource):
+    """ powerstat samples from one long-lived process, 1 Hz """
+    name = "powerstat"
+    interval = 1
+    streaming = True
+
+    def __init__(self, command=POWERSTAT_COMMAND, guess=None):
+        self.command = command
+        self.guess = guess
+        self.reader = None
+
+    def read(self, timeout=None):
+        if self.reader is None:
+            self.reader = PowerStatReader(self.command)
+            self.reader.start()
+        try:
+            t, p = self.reader.readings.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        v = self.guess.voltage() if self.guess else 0
+        return Sample((p, v, p / v if v else 0), t)
+
+    def close(self):
+        if self.reader:
+            self.reader.stop()
@@ -0,0 +1,246 @@
+""" low overhead reader for every supply under /sys/class/power_supply
+
+supplies are discovered once and the attributes each one needs are kept open,
+a sample is one pread per attribute, hotplug is picked up from kernel uevents
+on a netlink socket, or by rescanning every `rescan_interval` seconds when the
+socket is not available
+"""
+import errno
+import os
+import socket
+import time
+
+from powerguess.metrics import metrics
+
+POWER_SUPPLY_ROOT = "/sys/class/power_supply"
+
+# µV, µA, µW, µAh, µWh
+BATTERY_ATTRS = ("present", "status", "capacity", "voltage_now", "current_now", "power_now",
+                 "charge_now", "charge_full", "energy_now", "energy_full")
+MAINS_ATTRS = ("online", "voltage_now", "current_now", "power_now", "current_max",
+               "voltage_max", "usb_type")
+BATTERY_TYPES = ("Battery", "UPS")
+_STRING_ATTRS = ("status", "usb_type")
+
+
+class PowerSupply:
+    """ one power_supply directory with its attribute files open """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        try:
+            with open(f"{path}/type") as f:
+                self.type = f.read().strip()
+        except OSError:
+            self.type = "Unknown"
+        self.is_battery = self.type in BATTERY_TYPES
+        self._fds = {}
+        for attr in BATTERY_ATTRS if self.is_battery else MAINS_ATTRS:
+            try:
+                self._fds[attr] = os.open(f"{path}/{attr}", os.O_RDONLY)
+            except OSError:  # not exposed by this driver
+                continue
+
+    def read_raw(self):
+        """ {attribute: int or str}, raises FileNotFoundError if the supply went away """
+        raw = {}
+        for attr, fd in self._fds.items():
+            try:
+                data = os.pread(fd, 64, 0).strip()
+            except OSError as e:
+                # an empty acpi battery slot answers ENODEV for everything but
+                # "present", only a missing directory means the supply is gone
+                if e.errno in (errno.ENODEV, errno.ENOENT) and not os.path.isdir(self.path):
+                    raise FileNotFoundError(errno.ENOENT, "power supply removed", self.path)
+                continue  # missing value, eg. ENODEV / ENODATA / EAGAIN while a charger renegotiates
+            if attr in _STRING_ATTRS:
+                raw[attr] = data.decode("utf-8", "replace")
+            else:
+                try:
+                    raw[attr] = int(data)
+                except ValueError:
+                    continue
+                if attr == "present" and not raw[attr]:
+                    break  # empty slot, nothing else to read
+        return raw
+
+    def read(self):
+        """ supply dict, None for an empty battery slot """
+        raw = self.read_raw()
+        if self.is_battery and not raw.get("present", 1):
+            return None
+        voltage = raw.get("voltage_now", 0) / 1000000
+        current = raw.get("current_now", 0) / 1000000
+        power = raw.get("power_now", 0) / 1000000 or abs(voltage * current)
+        if not self.is_battery:
+            usb_type = raw.get("usb_type", "")
+            if "[" in usb_type:  # "Unknown SDP DCP CDP [PD] PD_PPS"
+                usb_type = usb_type.split("[")[1].split("]")[0]
+            return {"name": self.name,
+                    "type": self.type,
+                    "usb_type": usb_type,
+                    "online": bool(raw.get("online", 0)),
+                    "voltage": voltage,
+                    "current": current,
+                    "power": power,
+                    "voltage_max": raw.get("voltage_max", 0) / 1000000,
+                    "current_max": raw.get("current_max", 0) / 1000000}
+
+        charge = raw.get("charge_now", 0) / 1000000
+        charge_full = raw.get("charge_full", 0) / 1000000
+        energy = raw.get("energy_now", 0) / 1000000  # Wh
+        energy_full = raw.get("energy_full", 0) / 1000000
+        if not charge and energy and voltage:  # energy reporting drivers
+            charge, charge_full = energy / voltage, energy_full / voltage
+        if not energy and charge and voltage:
+            energy, energy_full = charge * voltage, charge_full * voltage
+        return {"name": self.name,
+                "type": self.type,
+                "capacity": raw.get("capacity", 0),
+                "voltage": voltage,
+                "current": current,
+                "power": power,
+                "charge": charge,
+                "charge_full": charge_full,
+                "energy": energy,
+                "energy_full": energy_full,
+                "status": raw.get("status", ""),
+                "time_left": time_left(raw.get("status", ""), charge, charge_full, current)}
+
+    def close(self):
+        for fd in self._fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fds = {}
+
+
+def time_left(status, charge, charge_full, current):
+    """ hours to empty while discharging or to full while charging at the present current, -1 if unknown """
+    current = abs(current)
+    if not current:
+        return -1
+    if status == "Discharging":
+        return charge / current
+    if status == "Charging" and charge_full > charge:
+        return (charge_full - charge) / current
+    return -1
+
+
+def _uevent_socket():
+    """ non blocking NETLINK_KOBJECT_UEVENT socket, None where not permitted """
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, 15)
+        sock.bind((0, 1))  # kernel uevent multicast group
+        sock.setblocking(False)
+        return sock
+    except (OSError, AttributeError):
+        return None
+
+
+def aggregate_batteries(batteries):
+    """ one battery dict for several packs, eg. laptops with an internal and a removable one """
+    if not batteries:
+        return None
+    if len(batteries) == 1:
+        return batteries[0]
+    charge = sum(b["charge"] for b in batteries)
+    charge_full = sum(b["charge_full"] for b in batteries)
+    energy = sum(b["energy"] for b in batteries)
+    energy_full = sum(b["energy_full"] for b in batteries)
+    statuses = [b["status"] for b in batteries]
+    if "Discharging" in statuses:
+        status = "Discharging"
+    elif "Charging" in statuses:
+        status = "Charging"
+    else:
+        status = statuses[0]
+    # packs are in parallel on the same rail, voltage is weighted by stored charge
+    voltage = sum(b["voltage"] * b["charge"] for b in batteries) / charge if charge \
+        else sum(b["voltage"] for b in batteries) / len(batteries)
+    current = sum(b["current"] for b in batteries)
+    if energy_full:
+        capacity = round(energy / energy_full * 100)
+    else:
+        capacity = round(sum(b["capacity"] for b in batteries) / len(batteries))
+    return {"name": "+".join(b["name"] for b in batteries),
+            "type": "Battery",
+            "capacity": capacity,
+            "voltage": voltage,
+            "current": current,
+            "power": sum(b["power"] for b in batteries),
+            "charge": charge,
+            "charge_full": charge_full,
+            "energy": energy,
+            "energy_full": energy_full,
+            "status": status,
+            "time_left": time_left(status, charge, charge_full, current),
+            "packs": len(batteries)}
+
+
+class PowerSupplyReader:
+    """ batteries, AC / USB mains and USB-PD supplies from pre-opened sysfs attributes """
+
+    def __init__(self, root=POWER_SUPPLY_ROOT, rescan_interval=60, hotplug=True):
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self.supplies = []
+        self._uevents = _uevent_socket() if hotplug and root == POWER_SUPPLY_ROOT else None
+        self._last_scan = 0
+        self.discover()
+
+    def discover(self):
+        """ (re)open every supply under root """
+        for s in self.supplies:
+            s.close()
+        try:
+            names = sorted(os.listdir(self.root))
+        except OSError:
+            names = []
+        self.supplies = [PowerSupply(f"{self.root}/{n}") for n in names]
+        self._last_scan = time.monotonic()
+        metrics.inc("power_supply_discoveries")
+        return self.supplies
+
+    def _hotplugged(self):
+        if self._uevents is None:
+            return time.monotonic() - self._last_scan > self.rescan_interval
+        changed = False
+        while True:
+            try:
+                msg = self._uevents.recv(8192)
+            except OSError:  # BlockingIOError once drained
+                return changed
+            if b"SUBSYSTEM=power_supply" in msg and (msg.startswith(b"add@") or
+                                                     msg.startswith(b"remove@")):
+                changed = True
+
+    def sample(self):
+        """ [supply dict] for every supply, batteries and mains alike """
+        if self._hotplugged():
+            self.discover()
+        try:
+            readings = [s.read() for s in self.supplies]
+        except FileNotFoundError:  # a supply disappeared between uevents
+            self.discover()
+            readings = [s.read() for s in self.supplies]
+        return [r for r in readings if r is not None]
+
+    def batteries(self, readings=None):
+        readings = self.sample() if readings is None else readings
+        return [r for r in readings if r["type"] in BATTERY_TYPES]
+
+    def mains(self, readings=None):
+        """ AC, USB and USB-PD supplies """
+        readings = self.sample() if readings is None else readings
+        return [r for r in readings if r["type"] not in BATTERY_TYPES]
+
+    def close(self):
+        for s in self.supplies:
+            s.close()
+        self.supplies = []
+        if self._uevents:
+            self._uevents.close()
+            self._uevents = None
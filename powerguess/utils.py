@@ -1,18 +1,31 @@
+import hashlib
+import json
 import os
+import platform
 import subprocess
+import threading
 import time
+from contextlib import contextmanager
+
+from powerguess.metrics import metrics
+from powerguess.supply import POWER_SUPPLY_ROOT, PowerSupplyReader, BATTERY_TYPES, aggregate_batteries, \
+    time_left
+
+CACHE_DIR = os.path.expanduser("~/.cache/powerguess")
+DATA_DIR = os.path.expanduser("~/.local/share/powerguess")
 
 
 def transform_range(value: float, r1: tuple, r2: tuple):
     """ scale N from range (x, y) to (X, Y) """
     scale = (r2[1] - r2[0]) / (r1[1] - r1[0])
-    return (value - r1[0]) * scale
+    return (value - r1[0]) * scale + r2[0]
 
 
-def get_battery_info():
+def get_battery_info(root=POWER_SUPPLY_ROOT):
+    """ full uevent parse of every battery, BatterySnapshot uses the cheaper PowerSupplyReader """
     # https://www.kernel.org/doc/html/latest/power/power_supply_class.html
-    for b in os.listdir("/sys/class/power_supply/"):
-        with open(f"/sys/class/power_supply/{b}/uevent") as f:
+    for b in os.listdir(root):
+        with open(f"{root}/{b}/uevent") as f:
             data = f.read()
         voltage = 0
         is_battery = False
@@ -58,11 +71,91 @@ def get_battery_info():
                 "charge": charge,
                 "status": status,
                 "name": name,
-                "time_left": (1 / ((charge_full - charge) / current))
-                if current and charge_full - charge else -1
+                "time_left": time_left(status, charge, charge_full, current)
             }
 
 
+class BatterySnapshot:
+    """ PowerSupplyReader sample shared by every reader
+
+    the sysfs scan runs at most once per `ttl` seconds, inside a `tick()`
+    the snapshot is frozen so all sensors in one update report the same instant
+    """
+    ttl = 1
+    root = POWER_SUPPLY_ROOT
+    timestamp = 0
+    batteries = []
+    battery = None  # batteries aggregated into one
+    supplies = []  # batteries and mains
+    _reader = None
+    _ticks = 0
+    _lock = threading.RLock()
+
+    @classmethod
+    def reader(cls):
+        if cls._reader is None or cls._reader.root != cls.root:
+            if cls._reader:
+                cls._reader.close()
+            cls._reader = PowerSupplyReader(cls.root)
+        return cls._reader
+
+    @classmethod
+    def refresh(cls):
+        with cls._lock, metrics.timed("battery_scan"):
+            supplies = cls.reader().sample()
+            cls.supplies = supplies
+            cls.batteries = [s for s in supplies if s["type"] in BATTERY_TYPES]
+            cls.battery = aggregate_batteries(cls.batteries)
+            cls.timestamp = time.monotonic()
+        return cls.batteries
+
+    @classmethod
+    def get(cls, ttl=None):
+        ttl = cls.ttl if ttl is None else ttl
+        with cls._lock:
+            if cls._ticks or time.monotonic() - cls.timestamp < ttl:
+                metrics.inc("battery_snapshot_hits")
+                return cls.batteries
+            metrics.inc("battery_snapshot_misses")
+            return cls.refresh()
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls.timestamp = 0
+
+    @classmethod
+    @contextmanager
+    def tick(cls):
+        """ take one snapshot and hold it until the tick ends """
+        with cls._lock:
+            if not cls._ticks:
+                cls.refresh()
+            cls._ticks += 1
+        try:
+            yield cls.batteries
+        finally:
+            with cls._lock:
+                cls._ticks -= 1
+
+
+def get_batteries(ttl=None):
+    """ cached list of batteries, see BatterySnapshot """
+    return BatterySnapshot.get(ttl)
+
+
+def get_battery(ttl=None):
+    """ cached battery or None, several packs are aggregated into one """
+    BatterySnapshot.get(ttl)
+    return BatterySnapshot.battery
+
+
+def get_supplies(ttl=None):
+    """ cached list of every supply, batteries and AC / USB / USB-PD mains """
+    BatterySnapshot.get(ttl)
+    return BatterySnapshot.supplies
+
+
 def get_model():
     p = ""
     if os.path.isfile("/proc/device-tree/model"):
@@ -77,6 +170,14 @@ def get_model():
 
 
 def get_product_name():
+    # world readable on most x86 kernels, dmidecode needs root
+    try:
+        with open("/sys/class/dmi/id/product_name") as f:
+            name = f.read().strip()
+        if name:
+            return name
+    except OSError:
+        pass
     try:
         # ALL ALL=NOPASSWD: /usr/bin/dmidecode
         p = subprocess.check_output("sudo dmidecode | grep -A3 '^System Information'", shell=True).decode("utf-8")
@@ -85,20 +186,64 @@ def get_product_name():
         return ""
 
 
+def hardware_fingerprint():
+    """ cheap hash of files that change when the hardware does, no subprocesses """
+    h = hashlib.sha1(f"{platform.machine()} {os.cpu_count()}".encode("utf-8"))
+    for p in ("/proc/device-tree/model", "/sys/firmware/devicetree/base/model",
+              "/sys/class/dmi/id/product_name", "/sys/class/dmi/id/board_name",
+              "/sys/class/dmi/id/sys_vendor"):
+        try:
+            with open(p, "rb") as f:
+                h.update(f.read())
+        except OSError:
+            continue
+    try:
+        with open("/proc/cpuinfo") as f:
+            for l in f:
+                if l.startswith(("model name", "Hardware", "Revision", "Model")):
+                    h.update(l.encode("utf-8"))
+                    break
+    except OSError:
+        pass
+    return h.hexdigest()
+
+
+def load_hardware_cache():
+    """ cached detection results, empty if the hardware fingerprint changed """
+    try:
+        with open(f"{CACHE_DIR}/hardware.json") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("fingerprint") != hardware_fingerprint():
+        return {}
+    return cache
+
+
+def save_hardware_cache(**kwargs):
+    cache = load_hardware_cache()
+    cache.update(kwargs)
+    cache["fingerprint"] = hardware_fingerprint()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(f"{CACHE_DIR}/hardware.json.tmp", "w") as f:
+            json.dump(cache, f)
+        os.replace(f"{CACHE_DIR}/hardware.json.tmp", f"{CACHE_DIR}/hardware.json")
+    except OSError as e:
+        print(f"failed to cache hardware detection: {e}")
+
+
+def detect_model():
+    """ get_model() cached on disk until the hardware fingerprint changes """
+    cache = load_hardware_cache()
+    if "model" in cache:
+        return cache["model"]
+    model = get_model()
+    save_hardware_cache(model=model)
+    return model
+
+
 def get_energy_delta_per_second(unit="mWh"):
-    bat = list(get_battery_info())[0]
-    t = 1
-    time.sleep(t)
-    bat2 = list(get_battery_info())[0]
-    delta = bat2["charge"] - bat["charge"]
-    current = delta * t
-    p = bat2["voltage"] * current
-    e = p * (t / 3600)
-    if unit == "mWh":
-        e = e * 1000
-    elif unit == "kWh":
-        e = e / 1000
-    else:
-        unit = "Wh"
-    unit += "/s"
-    return e, unit
+    """ non blocking, rate over the shared BatteryDeltaMonitor window """
+    from powerguess.delta import get_delta_monitor
+    return get_delta_monitor().energy_rate(unit)
@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+
+from powerguess.dispatch import CallbackDispatcher
+
+
+class TestCallbackDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = CallbackDispatcher()
+        self.addCleanup(self.dispatcher.stop)
+
+    def wait_for(self, condition, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "callback not delivered in time")
+            time.sleep(0.001)
+
+    def test_slow_subscriber_gets_latest(self):
+        release = threading.Event()
+        started = threading.Event()
+        seen = []
+
+        def slow(reading):
+            seen.append(reading)
+            started.set()
+            release.wait(2)
+
+        self.dispatcher.publish([slow], 1)
+        self.assertTrue(started.wait(2))
+        for reading in (2, 3, 4):  # while slow is busy with 1
+            self.dispatcher.publish([slow], reading)
+        release.set()
+        self.wait_for(lambda: len(seen) == 2 and self.dispatcher.stats()[slow.__qualname__]["calls"] == 2)
+        self.assertEqual(seen, [1, 4])
+        stats = self.dispatcher.stats()[slow.__qualname__]
+        self.assertEqual(stats["drops"], 2)
+        self.assertEqual(stats["pending"], 0)
+
+    def test_slow_subscriber_does_not_block_others(self):
+        release = threading.Event()
+        fast_seen = []
+        self.addCleanup(release.set)
+
+        def slow(reading):
+            release.wait(2)
+
+        def fast(reading):
+            fast_seen.append(reading)
+
+        for reading in range(5):
+            self.dispatcher.publish([slow, fast], reading)
+            self.wait_for(lambda: fast_seen and fast_seen[-1] == reading)
+        self.assertEqual(fast_seen, list(range(5)))
+
+    def test_errors_counted(self):
+        def broken(reading):
+            raise RuntimeError("boom")
+
+        self.dispatcher.publish([broken], 1)
+        self.wait_for(lambda: self.dispatcher.stats()[broken.__qualname__]["calls"] == 1)
+        self.assertEqual(self.dispatcher.stats()[broken.__qualname__]["errors"], 1)
+
+    def test_removed_callback_not_called(self):
+        release = threading.Event()
+        started = threading.Event()
+        seen = []
+
+        def cb(reading):
+            seen.append(reading)
+            started.set()
+            release.wait(2)
+
+        self.dispatcher.publish([cb], 1)
+        self.assertTrue(started.wait(2))
+        self.dispatcher.publish([cb], 2)
+        self.dispatcher.remove(cb)
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual(seen, [1])
+        self.assertNotIn(cb.__qualname__, self.dispatcher.stats())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import shutil
+import tempfile
+import unittest
+
+from powerguess.energy import EnergyMeter
+
+
+class TestEnergyMeter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        self.path = f"{self.dir}/energy.journal"
+
+    def meter(self, **kwargs):
+        return EnergyMeter(self.path, fsync=False, **kwargs)
+
+    def lines(self):
+        with open(self.path) as f:
+            return f.readlines()
+
+    def test_trapezoidal_integration(self):
+        meter = EnergyMeter(None, max_gap=3600)
+        meter.add(10, timestamp=0)
+        meter.add(30, timestamp=1800)
+        self.assertAlmostEqual(meter.total, 10.0)  # 20 W for half an hour
+        meter.add(30, timestamp=1800 + 3601)  # longer than max_gap, not integrated
+        self.assertAlmostEqual(meter.total, 10.0)
+
+    def test_restored_after_restart(self):
+        meter = self.meter(checkpoint_interval=60)
+        for t in range(0, 301, 30):
+            meter.add(36, timestamp=t)
+        meter.checkpoint()
+        self.assertAlmostEqual(self.meter().total, 3.0)
+
+    def test_torn_line_ignored(self):
+        meter = self.meter(checkpoint_interval=10)
+        meter.add(36, timestamp=0)
+        meter.add(36, timestamp=100)
+        with open(self.path, "a") as f:
+            f.write("1700000000.000 99")  # crashed mid write
+        self.assertAlmostEqual(self.meter().total, 1.0)
+
+    def test_compaction(self):
+        meter = self.meter(checkpoint_interval=1, max_lines=5)
+        meter.add(3600, timestamp=0)
+        for t in range(1, 20):  # a checkpoint every reading
+            meter.add(3600, timestamp=t)
+            self.assertLessEqual(len(self.lines()), 5)
+        self.assertAlmostEqual(self.meter().total, 19.0)
+
+    def test_reset(self):
+        meter = self.meter()
+        meter.add(3600, timestamp=0)
+        meter.add(3600, timestamp=1)
+        meter.reset()
+        self.assertEqual(len(self.lines()), 1)
+        self.assertEqual(self.meter().total, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
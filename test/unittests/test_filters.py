@@ -0,0 +1,70 @@
+import unittest
+
+from powerguess.filters import MovingAverage, EMA, MedianFilter, KalmanFilter, Deadband, \
+    FilterChain, ReadingFilter, make_filter
+from powerguess.monitor import PowerMonitor
+from powerguess.sources import PowerSource
+
+
+class TestStreamFilters(unittest.TestCase):
+    def test_moving_average(self):
+        f = MovingAverage(3)
+        self.assertEqual([f.update(x) for x in (3, 6, 9, 12)], [3, 4.5, 6, 9])
+        f.reset()
+        self.assertEqual(f.update(1), 1)
+
+    def test_ema(self):
+        f = EMA(0.5)
+        self.assertEqual([f.update(x) for x in (10, 20, 20)], [10, 15, 17.5])
+
+    def test_median_drops_spikes(self):
+        f = MedianFilter(3)
+        self.assertEqual([f.update(x) for x in (5, 100, 5, 6, 7)], [5, 52.5, 5, 6, 6])
+
+    def test_kalman_settles(self):
+        f = KalmanFilter()
+        for _ in range(200):
+            value = f.update(10)
+        self.assertAlmostEqual(value, 10)
+        # a single outlier only moves the estimate part of the way
+        self.assertLess(f.update(20), 15)
+
+    def test_deadband(self):
+        f = Deadband(0.5)
+        self.assertEqual([f.update(x) for x in (10, 10.4, 9.6, 10.6)], [10, 10, 10, 10.6])
+        f = Deadband(0.1, relative=True)
+        self.assertEqual([f.update(x) for x in (10, 10.9, 11.1)], [10, 10, 11.1])
+
+    def test_make_filter(self):
+        self.assertIsInstance(make_filter("ema"), EMA)
+        self.assertEqual(make_filter({"name": "mean", "n": 5}).n, 5)
+        chain = make_filter(["median", {"name": "ema", "alpha": 0.1}])
+        self.assertIsInstance(chain, FilterChain)
+        self.assertIsInstance(chain.filters[0], MedianFilter)
+        with self.assertRaises(ValueError):
+            make_filter(5)
+
+
+class TestReadingFilter(unittest.TestCase):
+    def test_current_derived_from_filtered_power(self):
+        f = ReadingFilter(p={"name": "mean", "n": 2})
+        f.update((10, 5, 2))
+        p, v, i = f.update((20, 5, 4))
+        self.assertEqual((p, v, i), (15, 5, 3))
+
+    def test_independent_outputs(self):
+        f = ReadingFilter(p="mean", i="ema")
+        f.update((10, 5, 2))
+        self.assertEqual(f.update((20, 5, 4)), (15, 5, 2 + 0.3 * 2))
+
+    def test_base_added_after_filtering(self):
+        monitor = PowerMonitor(PowerSource(), register=False, filters={"p": {"name": "mean", "n": 2}})
+        self.addCleanup(monitor.dispatcher.stop)
+        monitor.on_reading((10, 5, 2), base=(20, 4))
+        monitor.on_reading((10, 5, 2), base=(0, 0))
+        # the charging load is not smoothed into the measured power
+        self.assertEqual(monitor.current_value, (10, 5, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
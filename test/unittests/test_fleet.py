@@ -0,0 +1,40 @@
+import threading
+import unittest
+
+from powerguess.fleet import FleetAggregator, encode_packet
+
+
+class TestFleetAggregator(unittest.TestCase):
+    def test_model_change(self):
+        agg = FleetAggregator()
+        agg.ingest("kitchen", "a", [(1.0, 2.0, 5.0, 0.4), (2.0, 2.0, 5.0, 0.4)], now=0)
+
+        done = threading.Event()
+
+        def switch():
+            agg.ingest("kitchen", "b", [(3.0, 4.0, 5.0, 0.8)], now=1)
+            done.set()
+
+        threading.Thread(target=switch, daemon=True).start()
+        self.assertTrue(done.wait(2), "ingest deadlocked on a model change")
+
+        summary = agg.summary()
+        self.assertEqual(summary["devices"], 1)
+        self.assertEqual(agg.device("kitchen")["model"], "b")
+        self.assertEqual(summary["models"]["b"]["devices"], 1)
+        self.assertEqual(summary["models"]["b"]["power"], 4.0)
+        self.assertEqual(summary["models"]["a"]["devices"], 0)
+        self.assertEqual(summary["power"], 4.0)
+
+    def test_duplicates_not_counted(self):
+        agg = FleetAggregator()
+        readings = [(1.0, 2.0, 5.0, 0.4), (2.0, 2.0, 5.0, 0.4)]
+        agg.ingest_packet(encode_packet("kitchen", "a", readings), now=0)
+        agg.ingest_packet(encode_packet("kitchen", "a", readings), now=1)
+        self.assertEqual(agg.device("kitchen")["readings"], 2)
+        self.assertEqual(agg.summary()["readings"], 2)
+        self.assertAlmostEqual(agg.device("kitchen")["energy"], 2.0 / 3600)
+
+
+if __name__ == "__main__":
+    unittest.main()
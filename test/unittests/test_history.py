@@ -0,0 +1,59 @@
+import unittest
+
+from powerguess.history import PowerHistory, RingBuffer
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_wraps(self):
+        buf = RingBuffer(3)
+        for t in range(5):
+            buf.append((t, t * 10, 0, 0, 0, 0, 1))
+        self.assertEqual(len(buf), 3)
+        self.assertEqual(buf.column("t"), [2, 3, 4])
+        self.assertEqual(buf.oldest, 2)
+        self.assertEqual(buf.bisect(3), 1)
+        self.assertEqual(buf.column("p", 1), [30, 40])
+
+
+class TestPowerHistory(unittest.TestCase):
+    def test_rollup(self):
+        h = PowerHistory(((1, 120), (60, 10)))
+        for t in range(120):
+            h.add(10 if t < 60 else 20, 5, 2, timestamp=t)
+        h.add(0, 0, 0, timestamp=120)  # closes the second minute
+        minutes = h.tiers[1].buffer
+        self.assertEqual(minutes.column("t"), [0, 60])
+        self.assertEqual(minutes.column("p"), [10, 20])
+        self.assertEqual(minutes.column("n"), [60, 60])
+
+    def test_min_max_kept(self):
+        h = PowerHistory(((1, 10), (60, 10)))
+        for t, p in enumerate((5, 50, 1, 5)):
+            h.add(p, 5, 1, timestamp=100 + t)
+        h.add(5, 5, 1, timestamp=200)
+        s = h.stats(0, 150)  # older than the 1 s tier, from the minutes
+        self.assertEqual((s["min"], s["max"]), (1, 50))
+        self.assertAlmostEqual(s["mean"], 15.25)
+
+    def test_mean_weighted_by_readings(self):
+        h = PowerHistory(((1, 10), (60, 10)))
+        for t in range(59):
+            h.add(10, 5, 2, timestamp=t)
+        h.add(100, 5, 20, timestamp=60)  # a minute with one reading
+        h.add(1, 1, 1, timestamp=121)
+        s = h.stats(0, 119)
+        self.assertEqual(s["count"], 2)
+        self.assertAlmostEqual(s["mean"], (59 * 10 + 100) / 60)
+
+    def test_finest_tier_queried(self):
+        h = PowerHistory(((1, 100), (60, 10)))
+        for t in range(200):
+            h.add(t, 5, 1, timestamp=t)
+        # the seconds tier still reaches back to 150
+        self.assertEqual(h.query(150, 152), [(150, 150), (151, 151), (152, 152)])
+        # only the minutes reach back to 0
+        self.assertEqual([t for t, p in h.query(0, 199)], [0, 60, 120])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+from powerguess.publish import SensorPublisher
+
+
+class FakeSensor:
+    """ what SensorPublisher needs of an ovos_PHAL_sensors sensor """
+    device_name = "power"
+    _once = False
+    _slow = False
+
+    def __init__(self, unique_id, value=0.0, deadband=0):
+        self.unique_id = unique_id
+        self._value = value
+        self.deadband = deadband
+        self.reads = 0
+
+    @property
+    def value(self):
+        self.reads += 1
+        if isinstance(self._value, Exception):
+            raise self._value
+        return self._value
+
+
+class TestSensorPublisher(unittest.TestCase):
+    def published(self, publisher, sensors, now):
+        return [s.unique_id for s, value in publisher.select(sensors, now)]
+
+    def test_deadband(self):
+        publisher = SensorPublisher()
+        watts = FakeSensor("watts", 10.0, deadband=0.5)
+        self.assertEqual(self.published(publisher, [watts], 0), ["watts"])
+        watts._value = 10.4
+        self.assertEqual(self.published(publisher, [watts], 1), [])
+        watts._value = 10.6  # compared with 10, the last published value
+        self.assertEqual(self.published(publisher, [watts], 2), ["watts"])
+
+    def test_deadband_override(self):
+        watts = FakeSensor("watts", 10.0, deadband=5)
+        publisher = SensorPublisher(deadbands={"power_watts": 0})
+        self.published(publisher, [watts], 0)
+        watts._value = 10.1
+        self.assertEqual(self.published(publisher, [watts], 1), ["watts"])
+
+    def test_unchanged_values_skipped(self):
+        publisher = SensorPublisher()
+        status = FakeSensor("status", "Charging")
+        self.published(publisher, [status], 0)
+        self.assertEqual(self.published(publisher, [status], 1), [])
+        status._value = "Full"
+        self.assertEqual(self.published(publisher, [status], 2), ["status"])
+
+    def test_max_age(self):
+        publisher = SensorPublisher(max_age=60)
+        watts = FakeSensor("watts", 10.0)
+        self.published(publisher, [watts], 0)
+        self.assertEqual(self.published(publisher, [watts], 59), [])
+        self.assertEqual(self.published(publisher, [watts], 60), ["watts"])
+        publisher.forget(watts)
+        self.assertEqual(self.published(publisher, [watts], 61), ["watts"])
+
+    def test_failing_sensor_disabled(self):
+        publisher = SensorPublisher()
+        broken = FakeSensor("broken", OSError("gone"))
+        ok = FakeSensor("ok", 1.0)
+        for now in range(5):
+            self.assertEqual(self.published(publisher, [broken, ok], now), ["ok"] if not now else [])
+        self.assertEqual(broken.reads, 3)
+        self.assertIn("power_broken", publisher.disabled)
+
+    def test_failures_must_be_consecutive(self):
+        publisher = SensorPublisher()
+        flaky = FakeSensor("flaky", OSError("busy"))
+        for now in range(2):
+            self.published(publisher, [flaky], now)
+        flaky._value = 1.0
+        self.assertEqual(self.published(publisher, [flaky], 2), ["flaky"])
+        flaky._value = OSError("busy")
+        for now in range(3, 5):
+            self.published(publisher, [flaky], now)
+        self.assertEqual(publisher.disabled, set())
+
+    def test_once_and_slow(self):
+        publisher = SensorPublisher()
+        model = FakeSensor("model", "pi4")
+        model._once = True
+        capacity = FakeSensor("capacity", 50)
+        capacity._slow = True
+        for now in (0, 1, publisher.slow_interval):
+            publisher.select([model, capacity], now)
+        self.assertEqual(model.reads, 1)
+        self.assertEqual(capacity.reads, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from powerguess.rapl import RAPLReader, find_rapl_domains
+
+
+class TestRAPL(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+
+    def zone(self, zone, name, energy, max_range=1000000000):
+        path = f"{self.root}/{zone}"
+        os.makedirs(path, exist_ok=True)
+        with open(f"{path}/name", "w") as f:
+            f.write(f"{name}\n")
+        with open(f"{path}/max_energy_range_uj", "w") as f:
+            f.write(f"{max_range}\n")
+        self.energy(zone, energy)
+
+    def energy(self, zone, uj):
+        with open(f"{self.root}/{zone}/energy_uj", "w") as f:
+            f.write(f"{uj}\n")
+
+    def test_counter_wraparound(self):
+        self.zone("intel-rapl:0", "package-0", 999000000)
+        domain, = find_rapl_domains(self.root)
+        self.addCleanup(domain.close)
+        self.assertIsNone(domain.sample(timestamp=0))
+        self.assertAlmostEqual(domain.sample(timestamp=1), 0)
+        # 1 J to the top of the range, 4 J after wrapping
+        self.energy("intel-rapl:0", 4000000)
+        self.assertAlmostEqual(domain.sample(timestamp=2), 5.0)
+
+    def test_packages_summed_and_subzones_named(self):
+        self.zone("intel-rapl:0", "package-0", 0)
+        self.zone("intel-rapl:0:0", "core", 0)
+        self.zone("intel-rapl:1", "package-1", 0)
+        reader = RAPLReader(self.root)
+        self.addCleanup(reader.close)
+        self.assertEqual([d.name for d in reader.domains],
+                         ["package-0", "package-0/core", "package-1"])
+        self.assertIsNone(reader.power())
+        for d, uj in zip(reader.domains, (3000000, 2000000, 1000000)):
+            d.energy -= uj  # as if that much was used since the first sample
+            d.timestamp -= 1
+        # subzones are part of their package, only packages are added up
+        self.assertAlmostEqual(reader.power(), 4.0, places=1)
+
+    def test_psys_preferred(self):
+        self.zone("intel-rapl:0", "package-0", 0)
+        self.zone("intel-rapl:1", "psys", 0)
+        reader = RAPLReader(self.root)
+        self.addCleanup(reader.close)
+        reader.power()
+        for d, uj in zip(reader.domains, (3000000, 10000000)):
+            d.energy -= uj
+            d.timestamp -= 1
+        self.assertAlmostEqual(reader.power(), 10.0, places=1)
+
+    def test_no_zones(self):
+        self.assertFalse(RAPLReader(f"{self.root}/missing").available)
+
+
+if __name__ == "__main__":
+    unittest.main()
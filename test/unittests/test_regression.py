@@ -0,0 +1,63 @@
+import random
+import shutil
+import tempfile
+import unittest
+
+from powerguess.regression import OnlinePowerModel
+
+
+def watts(x):
+    # idle 2 W, busiest core 3 W, frequency 1.5 W
+    return 2.0 + 3.0 * x[1] + 1.5 * x[2]
+
+
+class TestOnlinePowerModel(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def features(self):
+        return [1.0, self.rng.random(), self.rng.uniform(0.4, 1.0)]
+
+    def test_converges(self):
+        model = OnlinePowerModel(3)
+        self.assertFalse(model.trained)
+        for _ in range(200):
+            x = self.features()
+            model.update(x, watts(x))
+        self.assertTrue(model.trained)
+        for w, expected in zip(model.weights, (2.0, 3.0, 1.5)):
+            self.assertAlmostEqual(w, expected, places=3)
+        x = [1.0, 0.5, 0.8]
+        self.assertAlmostEqual(model.predict(x), watts(x), places=3)
+
+    def test_follows_drift(self):
+        model = OnlinePowerModel(3, forgetting=0.95)
+        for _ in range(200):
+            x = self.features()
+            model.update(x, watts(x))
+        for _ in range(200):  # eg. a fan that started spinning
+            x = self.features()
+            model.update(x, watts(x) + 1.0)
+        self.assertAlmostEqual(model.weights[0], 3.0, places=2)
+
+    def test_persisted(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = f"{directory}/models/device.json"
+        model = OnlinePowerModel(3, path=path, save_every=50)
+        for _ in range(100):
+            x = self.features()
+            model.update(x, watts(x))
+
+        loaded = OnlinePowerModel.load(path)
+        self.assertEqual(loaded.samples, 100)
+        self.assertEqual(loaded.weights, model.weights)
+        self.assertEqual(loaded.P, model.P)
+        self.assertTrue(loaded.trained)
+        # keeps learning where the saved model stopped
+        x = self.features()
+        self.assertAlmostEqual(loaded.update(x, watts(x)), model.update(x, watts(x)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from powerguess.runtime import BatteryRuntimePredictor
+
+
+class TestBatteryRuntimePredictor(unittest.TestCase):
+    def test_time_to_empty(self):
+        r = BatteryRuntimePredictor(tau=600)
+        for t in range(0, 600, 10):
+            r.update(10, 40, 50, "Discharging", timestamp=t)
+        hours, lower, upper = r.time_to_empty()
+        self.assertAlmostEqual(hours, 4.0)
+        self.assertAlmostEqual(lower, 4.0)
+        self.assertAlmostEqual(upper, 4.0)
+        self.assertIsNone(r.time_to_full())
+
+    def test_spike_barely_moves_estimate(self):
+        r = BatteryRuntimePredictor(tau=600)
+        for t in range(0, 600, 10):
+            r.update(10, 40, 50, "Discharging", timestamp=t)
+        r.update(100, 40, 50, "Discharging", timestamp=600)
+        hours, lower, upper = r.time_to_empty()
+        self.assertGreater(hours, 3.4)  # 0.4 h at the instantaneous rate
+        self.assertLess(lower, hours)
+        self.assertGreater(upper, hours)
+
+    def test_time_to_full(self):
+        r = BatteryRuntimePredictor()
+        r.update(20, 10, 50, "Charging", timestamp=0)
+        self.assertEqual(r.time_to_full(), (2.0, 2.0, 2.0))
+        self.assertIsNone(r.time_to_empty())
+
+    def test_unknown_energy(self):
+        # energy_now 0 while discharging means the battery does not report it
+        r = BatteryRuntimePredictor()
+        r.update(10, 0, 0, "Discharging", timestamp=0)
+        self.assertIsNone(r.time_to_empty())
+        r.update(10, 20, 0, "Charging", timestamp=10)
+        self.assertIsNone(r.time_to_full())
+
+    def test_unknown_rate(self):
+        r = BatteryRuntimePredictor()
+        r.update(0, 40, 50, "Discharging", timestamp=0)
+        self.assertIsNone(r.time_to_empty())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+
+from powerguess.shm import ReadingBusPublisher, ReadingBusClient, SharedMemorySource, \
+    _CURRENT_OFFSET, _RING_OFFSET
+
+
+class TestReadingBus(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        self.path = f"{self.dir}/bus"
+
+    def publisher(self, capacity=10):
+        pub = ReadingBusPublisher(self.path, capacity)
+        self.addCleanup(pub.close)
+        return pub
+
+    def client(self, **kwargs):
+        client = ReadingBusClient(self.path, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_round_trip(self):
+        pub = self.publisher(capacity=3)
+        client = self.client()
+        self.assertEqual(client.history(), [])
+        for k in range(1, 5):
+            pub.publish((k, 5.0, k / 5), "pi", energy=k / 10, timestamp=100 + k)
+        r = client.reading()
+        self.assertEqual((r["p"], r["v"], r["i"], r["t"]), (4, 5.0, 0.8, 104))
+        self.assertEqual((r["energy"], r["count"], r["model"]), (0.4, 4, "pi"))
+        self.assertEqual(client.current(), (4, 5.0, 0.8))
+        self.assertEqual([rec[1] for rec in client.history()], [2, 3, 4])
+        self.assertEqual([rec[1] for rec in client.history(2)], [3, 4])
+
+    def test_no_torn_reads(self):
+        pub = self.publisher(capacity=100)
+        client = self.client()
+        stop = threading.Event()
+
+        def write():
+            k = 0
+            while not stop.is_set():
+                k += 1
+                pub.publish((k, k, k), "m", timestamp=k)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        self.addCleanup(writer.join)
+        self.addCleanup(stop.set)
+        for _ in range(2000):
+            r = client.reading()
+            self.assertTrue(r["t"] == r["p"] == r["v"] == r["i"])
+            for record in client.history(5):
+                self.assertEqual(len(set(record)), 1)
+
+    def test_corrupt_snapshot_rejected(self):
+        pub = self.publisher()
+        pub.publish((1.0, 5.0, 0.2), "m", timestamp=1)
+        client = self.client(timeout=0.05)
+        # seq is even but the payload is not what was checksummed, eg. a stale cache line
+        pub.mm[_CURRENT_OFFSET + 8:_CURRENT_OFFSET + 16] = struct.pack("<d", 99.0)
+        with self.assertRaises(TimeoutError):
+            client.current()
+        pub.mm[_RING_OFFSET + 8:_RING_OFFSET + 16] = struct.pack("<d", 99.0)
+        with self.assertRaises(TimeoutError):
+            client.history()
+
+    def test_reattach_after_restart(self):
+        pub = self.publisher()
+        pub.publish((1.0, 5.0, 0.2), "old", timestamp=1)
+        client = self.client(check_interval=0)
+        lagging = self.client(check_interval=3600)
+        self.assertEqual(client.reading()["model"], "old")
+
+        restarted = self.publisher()
+        # the old segment stays intact for clients that did not reattach yet
+        self.assertEqual(lagging.reading()["model"], "old")
+        restarted.publish((2.0, 5.0, 0.4), "new", timestamp=2)
+        r = client.reading()
+        self.assertEqual((r["p"], r["model"], r["count"]), (2.0, "new", 1))
+
+    def test_source_restart(self):
+        pub = self.publisher()
+        source = SharedMemorySource(self.path)
+        self.addCleanup(source.close)
+        source.client.check_interval = 0
+        self.assertIsNone(source.read())
+        pub.publish((1.0, 5.0, 0.2), "m")
+        pub.publish((2.0, 5.0, 0.4), "m")
+        self.assertEqual(source.read(), (2.0, 5.0, 0.4))
+        self.assertIsNone(source.read())
+
+        # the new daemon counts from 0 again
+        restarted = self.publisher()
+        restarted.publish((3.0, 5.0, 0.6), "m")
+        self.assertEqual(source.read(), (3.0, 5.0, 0.6))
+
+    def test_not_a_bus(self):
+        with open(self.path, "wb") as f:
+            f.write(bytes(4096))
+        with self.assertRaises(ValueError):
+            ReadingBusClient(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
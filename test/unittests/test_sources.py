@@ -0,0 +1,44 @@
+import unittest
+
+from powerguess.regression import LearnedEstimator, OnlinePowerModel
+from powerguess.sources import GuessSource
+
+
+class FakeCounters:
+    """ CPUCounters stand in, features follow a settable load """
+
+    def __init__(self):
+        self.load = 0.0
+
+    def features(self):
+        return [1.0, self.load, 1.0, self.load]
+
+
+class TestGuessSource(unittest.TestCase):
+    def make_source(self):
+        counters = FakeCounters()
+        src = GuessSource("Raspberry Pi 4", cpu_source=lambda: counters.load * 100)
+        src.learned = LearnedEstimator()
+        src.learned.counters = counters
+        src.learned.model = OnlinePowerModel(len(counters.features()))
+        return src, counters
+
+    def test_learned_estimate_follows_load(self):
+        src, counters = self.make_source()
+        # one tick: estimate samples the features, the measured watts are learned on them
+        for n in range(200):
+            counters.load = (n % 10) / 10
+            src.estimate()
+            src.learned.learn(2 + 3 * counters.load)
+        self.assertTrue(src.learned.trained)
+
+        counters.load = 0.1
+        low = src.estimate()[0]
+        counters.load = 0.9
+        high = src.estimate()[0]
+        self.assertAlmostEqual(low, 2.3, places=2)
+        self.assertAlmostEqual(high, 4.7, places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from powerguess.supply import PowerSupplyReader
+
+
+def write_supply(root, name, **attrs):
+    path = f"{root}/{name}"
+    os.makedirs(path, exist_ok=True)
+    for attr, value in attrs.items():
+        # rewritten in place, the reader keeps the file open
+        with open(f"{path}/{attr}", "w") as f:
+            f.write(f"{value}\n")
+
+
+class TestPowerSupplyReader(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+
+    def reader(self, **kwargs):
+        reader = PowerSupplyReader(self.root, hotplug=False, **kwargs)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_rereads_open_attributes(self):
+        write_supply(self.root, "BAT0", type="Battery", present=1, status="Discharging",
+                     voltage_now=12000000, current_now=1000000, energy_now=24000000,
+                     energy_full=48000000)
+        reader = self.reader()
+        self.assertEqual(reader.batteries()[0]["power"], 12.0)
+        write_supply(self.root, "BAT0", current_now=2000000, status="Charging")
+        bat = reader.batteries()[0]
+        self.assertEqual(bat["power"], 24.0)
+        self.assertEqual(bat["status"], "Charging")
+
+    def test_energy_and_charge_reporting(self):
+        write_supply(self.root, "BAT0", type="Battery", present=1, status="Discharging",
+                     voltage_now=10000000, current_now=1000000,
+                     energy_now=20000000, energy_full=40000000)
+        write_supply(self.root, "BAT1", type="Battery", present=1, status="Discharging",
+                     voltage_now=10000000, current_now=1000000,
+                     charge_now=2000000, charge_full=4000000)
+        energy, charge = self.reader().batteries()
+        # energy_now in µWh, charge derived at the present voltage
+        self.assertAlmostEqual(energy["energy"], 20.0)
+        self.assertAlmostEqual(energy["charge"], 2.0)
+        # charge_now in µAh, energy derived at the present voltage
+        self.assertAlmostEqual(charge["charge"], 2.0)
+        self.assertAlmostEqual(charge["energy"], 20.0)
+        self.assertAlmostEqual(charge["energy_full"], 40.0)
+
+    def test_empty_slot_skipped(self):
+        write_supply(self.root, "AC", type="Mains", online=1)
+        write_supply(self.root, "BAT0", type="Battery", present=0, status="Unknown")
+        reader = self.reader()
+        self.assertEqual(reader.batteries(), [])
+        self.assertEqual([m["name"] for m in reader.mains()], ["AC"])
+
+    def test_supply_disappears(self):
+        write_supply(self.root, "AC", type="Mains", online=1)
+        write_supply(self.root, "usb", type="USB", online=1, voltage_now=5000000,
+                     current_now=500000)
+        reader = self.reader(rescan_interval=3600)
+        self.assertEqual(len(reader.sample()), 2)
+
+        shutil.rmtree(f"{self.root}/usb")
+        pread = os.pread
+
+        def removed(fd, n, offset):
+            # sysfs answers ENODEV on the open files of an unplugged supply
+            if os.readlink(f"/proc/self/fd/{fd}").startswith(f"{self.root}/usb/"):
+                raise OSError(errno.ENODEV, "No such device")
+            return pread(fd, n, offset)
+
+        with mock.patch("powerguess.supply.os.pread", removed):
+            readings = reader.sample()
+        self.assertEqual([r["name"] for r in readings], ["AC"])
+        self.assertEqual([s.name for s in reader.supplies], ["AC"])
+
+    def test_unreadable_attribute_is_missing(self):
+        write_supply(self.root, "usb", type="USB", online=1, voltage_now=5000000,
+                     current_now=500000)
+        reader = self.reader()
+        pread = os.pread
+
+        def renegotiating(fd, n, offset):
+            if os.readlink(f"/proc/self/fd/{fd}").endswith("/current_now"):
+                raise OSError(errno.ENODEV, "No such device")
+            return pread(fd, n, offset)
+
+        with mock.patch("powerguess.supply.os.pread", renegotiating):
+            usb = reader.mains()[0]
+        self.assertEqual(usb["voltage"], 5.0)
+        self.assertEqual(usb["current"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()